@@ -0,0 +1,76 @@
+"""Add content hash to DataItem
+
+Revision ID: 3c7d2e9f4b1a
+Revises: 9b2b80555012
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7d2e9f4b1a'
+down_revision: Union[str, Sequence[str], None] = '9b2b80555012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _content_hash(input_message, output_message) -> str:
+    # Frozen copy of models.compute_content_hash at the time of this migration
+    def normalize(messages):
+        if messages is None:
+            return None
+        return [{"type": m["type"], "content": m["content"]} for m in messages]
+
+    canonical = json.dumps(
+        [normalize(input_message), normalize(output_message)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('data_items', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    # Backfill existing rows in batches, keyed on id so each batch is an index range scan
+    bind = op.get_bind()
+    data_items = sa.table(
+        'data_items',
+        sa.column('id', sa.UUID()),
+        sa.column('input_message', sa.JSON()),
+        sa.column('output_message', sa.JSON()),
+        sa.column('content_hash', sa.String()),
+    )
+    last_id = None
+    while True:
+        query = sa.select(data_items.c.id, data_items.c.input_message, data_items.c.output_message)
+        if last_id is not None:
+            query = query.where(data_items.c.id > last_id)
+        rows = bind.execute(query.order_by(data_items.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        bind.execute(
+            data_items.update().where(data_items.c.id == sa.bindparam('item_id')),
+            [
+                {'item_id': row.id, 'content_hash': _content_hash(row.input_message, row.output_message)}
+                for row in rows
+            ],
+        )
+        last_id = rows[-1].id
+
+    op.create_index('ix_data_items_project_id_content_hash', 'data_items', ['project_id', 'content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_data_items_project_id_content_hash', table_name='data_items')
+    op.drop_column('data_items', 'content_hash')
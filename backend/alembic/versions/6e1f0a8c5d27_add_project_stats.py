@@ -0,0 +1,42 @@
+"""Add project stats
+
+Revision ID: 6e1f0a8c5d27
+Revises: 3c7d2e9f4b1a
+Create Date: 2026-10-19 11:40:03.527718
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1f0a8c5d27'
+down_revision: Union[str, Sequence[str], None] = '3c7d2e9f4b1a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows are not backfilled: a project's stats are rebuilt on first read or write
+    op.create_table('project_stats',
+    sa.Column('project_id', sa.UUID(), nullable=False),
+    sa.Column('item_count', sa.Integer(), nullable=False),
+    sa.Column('items_with_output', sa.Integer(), nullable=False),
+    sa.Column('text_messages', sa.Integer(), nullable=False),
+    sa.Column('image_messages', sa.Integer(), nullable=False),
+    sa.Column('text_length_total', sa.BigInteger(), nullable=False),
+    sa.Column('token_total', sa.BigInteger(), nullable=False),
+    sa.Column('length_histogram', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('token_histogram', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('project_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('project_stats')
@@ -0,0 +1,30 @@
+"""Rebucket project stats
+
+Revision ID: 8a4d6b2e1c70
+Revises: f5c0e7a2b913
+Create Date: 2026-10-19 17:02:41.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d6b2e1c70'
+down_revision: Union[str, Sequence[str], None] = 'f5c0e7a2b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Histograms moved from log2 buckets to gamma = 2^(1/8) buckets. Stats rows are
+    # derived data: each one is rebuilt from project_items on its next write or read.
+    op.execute('DELETE FROM project_stats')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DELETE FROM project_stats')
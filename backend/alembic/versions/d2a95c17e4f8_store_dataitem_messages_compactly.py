@@ -0,0 +1,139 @@
+"""Store DataItem messages compactly
+
+Only converts when MESSAGE_STORAGE=compact; with the default (json) the columns
+stay JSONB and this revision changes nothing.
+
+Revision ID: d2a95c17e4f8
+Revises: b84f3a61c9e0
+Create Date: 2026-10-19 14:31:48.660251
+
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a95c17e4f8'
+down_revision: Union[str, Sequence[str], None] = 'b84f3a61c9e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# A frozen copy of message_codec as of this revision, so later codec changes
+# can't change what this migration writes or reads.
+_JSON = ord('[')
+_PACKED = 0x01
+_PACKED_ZLIB = 0x02
+_TYPES = ('text', 'image')
+_COMPRESS_MIN_SIZE = 256
+_count = struct.Struct('<I')
+
+
+def _encode(messages):
+    if messages is None:
+        return None
+    contents = [m['content'] for m in messages]
+    count = len(messages)
+    body = b''.join((
+        _count.pack(count),
+        bytes(_TYPES.index(m['type']) for m in messages),
+        struct.pack(f'<{count}I', *(len(c) for c in contents)),
+        ''.join(contents).encode('utf-8'),
+    ))
+    if len(body) >= _COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            return bytes((_PACKED_ZLIB,)) + compressed
+    return bytes((_PACKED,)) + body
+
+
+def _decode(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    if value[0] == _JSON:
+        return json.loads(value)
+    body = zlib.decompress(value[1:]) if value[0] == _PACKED_ZLIB else value[1:]
+    (count,) = _count.unpack_from(body)
+    offset = _count.size
+    types = body[offset:offset + count]
+    offset += count
+    lengths = struct.unpack_from(f'<{count}I', body, offset)
+    text = body[offset + 4 * count:].decode('utf-8')
+    messages = []
+    start = 0
+    for code, length in zip(types, lengths):
+        messages.append({'type': _TYPES[code], 'content': text[start:start + length]})
+        start += length
+    return messages
+
+
+def _stored_as(type_) -> bool:
+    column = next(c for c in sa.inspect(op.get_bind()).get_columns('data_items') if c['name'] == 'input_message')
+    return isinstance(column['type'], type_)
+
+
+def _convert(source_type, target_type, convert) -> None:
+    """Rewrite both message columns into new columns of target_type, in id-ordered batches."""
+    op.add_column('data_items', sa.Column('input_message_new', target_type, nullable=True))
+    op.add_column('data_items', sa.Column('output_message_new', target_type, nullable=True))
+
+    bind = op.get_bind()
+    data_items = sa.table(
+        'data_items',
+        sa.column('id', sa.UUID()),
+        sa.column('input_message', source_type),
+        sa.column('output_message', source_type),
+        sa.column('input_message_new', target_type),
+        sa.column('output_message_new', target_type),
+    )
+    last_id = None
+    while True:
+        query = sa.select(data_items.c.id, data_items.c.input_message, data_items.c.output_message)
+        if last_id is not None:
+            query = query.where(data_items.c.id > last_id)
+        rows = bind.execute(query.order_by(data_items.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        bind.execute(
+            data_items.update().where(data_items.c.id == sa.bindparam('item_id')),
+            [
+                {
+                    'item_id': row.id,
+                    'input_message_new': convert(row.input_message),
+                    'output_message_new': convert(row.output_message),
+                }
+                for row in rows
+            ],
+        )
+        last_id = rows[-1].id
+
+    op.drop_column('data_items', 'input_message')
+    op.drop_column('data_items', 'output_message')
+    op.alter_column('data_items', 'input_message_new', new_column_name='input_message', nullable=False)
+    op.alter_column('data_items', 'output_message_new', new_column_name='output_message')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    storage = os.getenv('MESSAGE_STORAGE', 'json')
+    if storage not in ('json', 'compact'):
+        raise ValueError(f"MESSAGE_STORAGE must be 'json' or 'compact', not {storage!r}")
+    if storage != 'compact' or not _stored_as(postgresql.JSONB):
+        return
+    _convert(postgresql.JSONB(astext_type=sa.Text()), sa.LargeBinary(), _encode)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not _stored_as(sa.LargeBinary):
+        return
+    _convert(sa.LargeBinary(), postgresql.JSONB(astext_type=sa.Text()), _decode)
@@ -0,0 +1,72 @@
+"""Add project items membership and project forks
+
+Revision ID: f5c0e7a2b913
+Revises: d2a95c17e4f8
+Create Date: 2026-10-19 16:02:37.118540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c0e7a2b913'
+down_revision: Union[str, Sequence[str], None] = 'd2a95c17e4f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('projects', sa.Column('forked_from_id', sa.UUID(), nullable=True))
+    op.create_foreign_key('projects_forked_from_id_fkey', 'projects', 'projects', ['forked_from_id'], ['id'])
+
+    op.create_table('project_items',
+    sa.Column('project_id', sa.UUID(), nullable=False),
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('data_item_id', sa.UUID(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['data_item_id'], ['data_items.id'], ),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('project_id', 'id')
+    )
+    op.create_index(op.f('ix_project_items_data_item_id'), 'project_items', ['data_item_id'], unique=False)
+    # Every existing item belongs to the project that created it and keeps its id
+    op.execute(
+        "INSERT INTO project_items (project_id, id, data_item_id, deleted) "
+        "SELECT project_id, id, id, COALESCE(deleted, false) FROM data_items"
+    )
+    # Soft deletes now live on project_items
+    op.drop_column('data_items', 'deleted')
+
+    # Project reads now go through project_items, whose primary key replaces this index
+    op.drop_index('ix_data_items_project_id_id', table_name='data_items')
+    op.drop_index('ix_data_items_project_id_content_hash', table_name='data_items')
+    op.create_index('ix_data_items_content_hash', 'data_items', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_data_items_content_hash', table_name='data_items')
+    op.create_index('ix_data_items_project_id_content_hash', 'data_items', ['project_id', 'content_hash'], unique=False)
+    op.create_index('ix_data_items_project_id_id', 'data_items', ['project_id', 'id'], unique=False)
+
+    # Lossy: each project keeps only the rows it created and still shows. Items a
+    # fork shares with its parent are lost from the fork, and edited items come
+    # back under their content row's id.
+    op.add_column('data_items', sa.Column('deleted', sa.Boolean(), nullable=True))
+    op.execute(
+        "UPDATE data_items SET deleted = COALESCE(("
+        "SELECT project_items.deleted FROM project_items "
+        "WHERE project_items.project_id = data_items.project_id "
+        "AND project_items.data_item_id = data_items.id LIMIT 1"
+        "), true)"
+    )
+
+    op.drop_index(op.f('ix_project_items_data_item_id'), table_name='project_items')
+    op.drop_table('project_items')
+
+    op.drop_constraint('projects_forked_from_id_fkey', 'projects', type_='foreignkey')
+    op.drop_column('projects', 'forked_from_id')
@@ -0,0 +1,54 @@
+"""Compare message_codec against JSON for stored bytes per row and decode speed.
+
+Run from the backend directory:
+
+    python -m benchmarks.message_storage
+
+JSON size is measured as compact JSON text. JSONB is not smaller than that on
+disk, and psycopg2 hands it back as text that goes through json.loads, so the
+JSON numbers are an optimistic stand-in for the jsonb column.
+"""
+import random
+import timeit
+
+import message_codec
+
+WORDS = "the model should answer every question with a short and precise reply about data".split()
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _rows(kind, count=2000, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        if kind == "short chat":
+            rows.append(([{"type": "text", "content": _text(rng, 12)}], [{"type": "text", "content": _text(rng, 20)}]))
+        elif kind == "long text":
+            rows.append(([{"type": "text", "content": _text(rng, 400)}], [{"type": "text", "content": _text(rng, 300)}]))
+        else:
+            rows.append((
+                [{"type": "text", "content": _text(rng, 15)}, {"type": "image", "content": f"https://cdn.example.com/img/{rng.getrandbits(64):016x}.png"}],
+                [{"type": "text", "content": _text(rng, 25)}],
+            ))
+    return rows
+
+
+def run():
+    print(f"{'dataset':<12} {'format':<8} {'bytes/row':>10} {'decode rows/s':>14}")
+    for kind in ("short chat", "long text", "text+image"):
+        rows = _rows(kind)
+        for name, compact in (("json", False), ("compact", True)):
+            encoded = [(message_codec.encode(i, compact), message_codec.encode(o, compact)) for i, o in rows]
+            size = sum(len(i) + len(o) for i, o in encoded) / len(encoded)
+            seconds = min(timeit.repeat(
+                lambda: [(message_codec.decode(i), message_codec.decode(o)) for i, o in encoded],
+                number=5, repeat=3
+            )) / 5
+            print(f"{kind:<12} {name:<8} {size:>10.0f} {len(rows) / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import database, models, schemas
+
+# Postgres channel used to fan data item events out to every backend node.
+NOTIFY_CHANNEL = "data_item_events"
+# NOTIFY payloads are limited to 8000 bytes; bigger events only carry the item id
+# and the listening node loads the item back from the database.
+MAX_NOTIFY_PAYLOAD = 7900
+SUBSCRIBER_QUEUE_SIZE = 1000
+LISTEN_RETRY_MAX_DELAY = 30
+
+logger = logging.getLogger(__name__)
+
+
+def build_event(event_type: str, db_project_item: models.ProjectItem, project_id: UUID) -> dict:
+    item = None
+    if event_type != "deleted":
+        item = schemas.DataItem.model_validate(db_project_item).model_dump(mode="json")
+    return {
+        "type": event_type,
+        "project_id": str(project_id),
+        "item_id": str(db_project_item.id),
+        "item": item,
+    }
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    def __init__(self, project_id: str, loop: asyncio.AbstractEventLoop):
+        self.project_id = project_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event: dict):
+        # Called from any thread; the queue itself is only touched on its loop.
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow client fell behind: drop the backlog and ask it to reload.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "project_id": self.project_id})
+
+
+class EventBroker:
+    """In-process fan-out of data item events to the SSE subscribers of this node.
+
+    When the database is PostgreSQL, events are published with NOTIFY and a single
+    background LISTEN connection feeds them back into the local fan-out, so every
+    node sees every commit. Otherwise (single node, tests) events are delivered
+    directly.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, db: Session, project_id: UUID) -> Subscription:
+        if db.get_bind().dialect.name == "postgresql":
+            self._ensure_listener()
+        subscription = Subscription(str(project_id), asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[subscription.project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.project_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.project_id]
+
+    def dispatch(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event["project_id"], ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def publish(self, db: Session, event_type: str, db_project_item: models.ProjectItem, project_id: UUID):
+        """Publish an event for a change to a project's data item that has just been committed."""
+        event = build_event(event_type, db_project_item, project_id)
+        if db.get_bind().dialect.name != "postgresql":
+            self.dispatch(event)
+            return
+
+        payload = json.dumps(event)
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({**event, "item": None, "partial": True})
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": payload})
+        db.commit()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="data-item-events", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        # Runs for the life of the process: a dropped connection or a DB restart
+        # only pauses delivery, and subscribers are told to reload afterwards.
+        delay = 1
+        reconnecting = False
+        while True:
+            try:
+                connection = database.engine.raw_connection()
+            except Exception:
+                logger.exception("Could not connect to listen for data item events")
+                time.sleep(delay)
+                delay = min(delay * 2, LISTEN_RETRY_MAX_DELAY)
+                reconnecting = True
+                continue
+            try:
+                pg_connection = connection.dbapi_connection
+                pg_connection.autocommit = True
+                pg_connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                delay = 1
+                if reconnecting:
+                    # Anything committed while we were away was missed
+                    self._resync_all()
+                self._receive(pg_connection)
+            except Exception:
+                logger.exception("Lost the data item events connection")
+            finally:
+                try:
+                    connection.invalidate()
+                except Exception:
+                    pass
+            reconnecting = True
+            time.sleep(delay)
+            delay = min(delay * 2, LISTEN_RETRY_MAX_DELAY)
+
+    def _receive(self, pg_connection):
+        while True:
+            if select.select([pg_connection], [], [], 30) == ([], [], []):
+                continue
+            pg_connection.poll()
+            while pg_connection.notifies:
+                notify = pg_connection.notifies.pop(0)
+                event = json.loads(notify.payload)
+                try:
+                    event = self._load_partial(event)
+                except Exception:
+                    logger.exception("Could not load data item %s for its event", event.get("item_id"))
+                    event = {"type": "resync", "project_id": event["project_id"]}
+                self.dispatch(event)
+
+    def _resync_all(self):
+        with self._lock:
+            project_ids = list(self._subscribers)
+        for project_id in project_ids:
+            self.dispatch({"type": "resync", "project_id": project_id})
+
+    def _load_partial(self, event: dict) -> dict:
+        if not event.pop("partial", False):
+            return event
+        db = database.SessionLocal()
+        try:
+            db_project_item = db.get(models.ProjectItem, (UUID(event["project_id"]), UUID(event["item_id"])))
+            if db_project_item is not None:
+                event["item"] = schemas.DataItem.model_validate(db_project_item).model_dump(mode="json")
+        finally:
+            db.close()
+        return event
+
+
+broker = EventBroker()
@@ -0,0 +1,129 @@
+"""Project forks with copy-on-write data items.
+
+A project's items are its rows in project_items. Each row has the item's
+public id, stable for the life of the item, and points at the data_items row
+that currently stores its content. A fork starts by copying the parent's live
+project_items rows, keeping their ids (one INSERT ... SELECT), and its stats
+row. The content rows themselves are never copied.
+
+A content row is edited in place only while no other live item points at it.
+Otherwise the edit goes to a private copy and the editing item is repointed at
+it. Its id does not change, so parent and fork never see each other's edits.
+Soft deletes set the item's own deleted flag and can always be undone.
+"""
+from uuid import UUID
+
+from sqlalchemy import and_, false, func, insert, literal, not_, select
+from sqlalchemy.orm import Query, Session, contains_eager
+
+import models, stats
+
+
+def project_items(db: Session, project_id: UUID) -> Query:
+    """Query over every item in the project, soft-deleted ones included."""
+    return db.query(models.ProjectItem).join(models.ProjectItem.data_item).options(
+        contains_eager(models.ProjectItem.data_item)
+    ).filter(models.ProjectItem.project_id == project_id)
+
+
+def add_item(db: Session, project_id: UUID, db_data_item: models.DataItem) -> models.ProjectItem:
+    db_project_item = models.ProjectItem(project_id=project_id, data_item=db_data_item)
+    db.add(db_project_item)
+    return db_project_item
+
+
+def _copy(row: models.DataItem, project_id: UUID, **columns) -> models.DataItem:
+    return models.DataItem(
+        project_id=project_id,
+        input_message=row.input_message,
+        output_message=row.output_message,
+        created_at=row.created_at,
+        **columns
+    )
+
+
+def _sharing(db: Session, db_project_item: models.ProjectItem, row: models.DataItem) -> Query:
+    """The other items whose content is stored in row."""
+    return db.query(models.ProjectItem).filter(
+        models.ProjectItem.data_item_id == row.id,
+        not_(and_(
+            models.ProjectItem.project_id == db_project_item.project_id,
+            models.ProjectItem.id == db_project_item.id
+        ))
+    )
+
+
+def _lock_row(db: Session, db_project_item: models.ProjectItem) -> models.DataItem:
+    """Lock the content row the item points at, for the rest of the transaction."""
+    while True:
+        row_id = db_project_item.data_item_id
+        row = db.query(models.DataItem).filter(
+            models.DataItem.id == row_id
+        ).with_for_update().populate_existing().one()
+        # Whoever held the lock may have moved this item to a frozen copy meanwhile
+        db.refresh(db_project_item)
+        if db_project_item.data_item_id == row_id:
+            return row
+
+
+def writable_row(db: Session, db_project_item: models.ProjectItem) -> models.DataItem:
+    """The content row the item may modify in place, after copying it if it is shared."""
+    # Forks of this project take the same lock, so no new item can start
+    # sharing the row between the check below and the end of the transaction.
+    stats.lock_stats(db, db_project_item.project_id)
+    # Everyone editing through this row queues on it before looking at who else
+    # shares it. Locking only the other items' rows deadlocks a parent and a
+    # fork that edit a shared item at the same time.
+    row = _lock_row(db, db_project_item)
+    others = _sharing(db, db_project_item, row).join(
+        models.Project, models.Project.id == models.ProjectItem.project_id
+    ).with_entities(
+        models.ProjectItem.deleted, models.Project.deleted
+    ).order_by(
+        models.ProjectItem.project_id, models.ProjectItem.id
+    ).with_for_update(of=models.ProjectItem).all()
+    if not others:
+        return row
+
+    if any(not item_deleted and not project_deleted for item_deleted, project_deleted in others):
+        # Another live item shows this row: the edit goes to a private copy
+        copy = _copy(row, db_project_item.project_id, updated_at=func.now())
+        db_project_item.data_item = copy
+        return copy
+
+    # Only soft-deleted items or projects still point here. They move to one
+    # frozen copy of the current content, so they show it again if restored,
+    # and this and later edits happen in place.
+    frozen = _copy(row, row.project_id, updated_at=row.updated_at)
+    db.add(frozen)
+    db.flush()
+    _sharing(db, db_project_item, row).update({models.ProjectItem.data_item_id: frozen.id}, synchronize_session=False)
+    return row
+
+
+def fork_project(db: Session, parent: models.Project, name: str) -> models.Project:
+    # Lock the parent's stats row: item writers take it too, so the items and
+    # the stats copied below describe the same set of items.
+    parent_stats = stats.lock_stats(db, parent.id)
+
+    fork = models.Project(name=name, owner_id=parent.owner_id, forked_from_id=parent.id)
+    db.add(fork)
+    db.flush()
+
+    db.execute(insert(models.ProjectItem).from_select(
+        ["project_id", "id", "data_item_id", "deleted"],
+        select(
+            literal(fork.id, models.ProjectItem.project_id.type),
+            models.ProjectItem.id,
+            models.ProjectItem.data_item_id,
+            false()
+        ).where(
+            models.ProjectItem.project_id == parent.id,
+            models.ProjectItem.deleted == False
+        )
+    ))
+    db.add(models.ProjectStats(
+        project_id=fork.id,
+        **{column: getattr(parent_stats, column) for column in stats.COUNTERS + stats.HISTOGRAMS}
+    ))
+    return fork
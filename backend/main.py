@@ -1,12 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal
 from fastapi.middleware.cors import CORSMiddleware
 
 from uuid import UUID
-import models, schemas, database
+import models, schemas, database, events, stats, ratelimit, sampling, forks
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail at startup, not on the first read, when the message columns and
+    # MESSAGE_STORAGE disagree
+    models.check_message_storage(database.engine)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# Admission control: turn requests away before they queue for a DB connection.
+# Event streams count until they start streaming; they hold no connection after.
+app.add_middleware(
+    ratelimit.ConcurrencyLimitMiddleware,
+    streaming=lambda path: path.endswith("/events"),
+)
 
 # Add CORS middleware to allow requests from the frontend
 app.add_middleware(
@@ -46,7 +64,7 @@ def read_root():
     return {"message": "Welcome to the FastAPI API"}
 
 
-@app.post("/projects/", response_model=schemas.Project)
+@app.post("/projects/", response_model=schemas.Project, dependencies=[Depends(ratelimit.limit("write"))])
 def create_project(
     project: schemas.ProjectCreate,
     db: Session = Depends(database.get_db),
@@ -54,13 +72,15 @@ def create_project(
 ):
     db_project = models.Project(**project.model_dump(), owner_id=current_user.id)
     db.add(db_project)
+    db.flush()
+    db.add(models.ProjectStats(project_id=db_project.id))
     db.commit()
     db.refresh(db_project)
     return db_project
 
 from sqlalchemy import func
 
-@app.get("/projects/", response_model=List[schemas.Project])
+@app.get("/projects/", response_model=List[schemas.Project], dependencies=[Depends(ratelimit.limit("read"))])
 def list_projects(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
@@ -68,10 +88,12 @@ def list_projects(
     # Query projects with a count of their non-deleted data items
     results = db.query(
         models.Project,
-        func.count(models.DataItem.id).filter(
-            models.DataItem.deleted == False
+        func.count(models.ProjectItem.id).filter(
+            models.ProjectItem.deleted == False
         ).label("data_items_count")
-    ).outerjoin(models.DataItem).filter(
+    ).outerjoin(
+        models.ProjectItem, models.ProjectItem.project_id == models.Project.id
+    ).filter(
         models.Project.owner_id == current_user.id,
         models.Project.deleted == False
     ).group_by(models.Project.id).all()
@@ -83,7 +105,7 @@ def list_projects(
     return projects
 
 
-@app.patch("/projects/{project_id}", response_model=schemas.Project)
+@app.patch("/projects/{project_id}", response_model=schemas.Project, dependencies=[Depends(ratelimit.limit("write"))])
 def update_project(
     project_id: UUID,
     project: schemas.ProjectUpdate,
@@ -108,9 +130,86 @@ def update_project(
     db.refresh(db_project)
     return db_project
 
+@app.post("/projects/{project_id}/fork", response_model=schemas.Project, dependencies=[Depends(ratelimit.limit("bulk"))])
+def fork_project(
+    project_id: UUID,
+    project: schemas.ProjectFork,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    parent = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id,
+        models.Project.deleted == False
+    ).first()
+    if not parent:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    db_project = forks.fork_project(db, parent, project.name or f"{parent.name} (fork)")
+    db.commit()
+    db.refresh(db_project)
+    db_project.data_items_count = db_project.stats.item_count
+    return db_project
+
+@app.get("/projects/{project_id}/stats", response_model=schemas.ProjectStats, dependencies=[Depends(ratelimit.limit("read"))])
+def get_project_stats(
+    project_id: UUID,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Verify project ownership
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return stats.to_schema(stats.get_project_stats(db, project_id))
+
+@app.post("/projects/{project_id}/stats/rebuild", response_model=schemas.ProjectStats, dependencies=[Depends(ratelimit.limit("bulk"))])
+def rebuild_project_stats(
+    project_id: UUID,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Verify project ownership
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Serialize with concurrent item writers, which lock the same row
+    stats.lock_stats(db, project_id)
+    project_stats = stats.rebuild(db, project_id)
+    db.commit()
+    db.refresh(project_stats)
+    return stats.to_schema(project_stats)
+
 # --- DataItem Endpoints ---
 
-@app.get("/projects/{project_id}/data-items/", response_model=List[schemas.DataItem])
+def apply_item_update(db: Session, db_project_item: models.ProjectItem, update_data: dict) -> Optional[str]:
+    """Apply an update to an item and return the event it makes, or None if nothing changed."""
+    deleted = update_data.pop("deleted", None)
+    changes = {
+        key: value for key, value in update_data.items()
+        if getattr(db_project_item, key) != value
+    }
+    if changes:
+        # Edits to content shared with a fork or parent land on a private copy
+        row = forks.writable_row(db, db_project_item)
+        for key, value in changes.items():
+            setattr(row, key, value)
+
+    event_type = "updated" if changes else None
+    if deleted is not None and deleted != db_project_item.deleted:
+        db_project_item.deleted = deleted
+        event_type = "deleted" if deleted else "created"
+    return event_type
+
+@app.get("/projects/{project_id}/data-items/", response_model=List[schemas.DataItem], dependencies=[Depends(ratelimit.limit("read"))])
 def list_data_items(
     project_id: UUID,
     db: Session = Depends(database.get_db),
@@ -124,15 +223,16 @@ def list_data_items(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    return db.query(models.DataItem).filter(
-        models.DataItem.project_id == project_id,
-        models.DataItem.deleted == False
+    return forks.project_items(db, project_id).filter(
+        models.ProjectItem.deleted == False
     ).all()
 
-@app.post("/projects/{project_id}/data-items/", response_model=schemas.DataItem)
+@app.post("/projects/{project_id}/data-items/", response_model=schemas.DataItem, dependencies=[Depends(ratelimit.limit("write"))])
 def create_data_item(
     project_id: UUID,
     data_item: schemas.DataItemCreate,
+    response: Response,
+    on_conflict: Optional[Literal["skip", "update"]] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -144,16 +244,137 @@ def create_data_item(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
+    # Tells importers what happened: created, existing (skipped or unchanged) or updated
+    response.headers["X-Data-Item-Result"] = "created"
+    if on_conflict is not None:
+        # Every item write in the project takes this lock, so a concurrent import
+        # of the same payload waits here and then sees the other one's row.
+        stats.lock_stats(db, project_id)
+        payload = data_item.model_dump()
+        content_hash = models.compute_content_hash(payload["input_message"], payload["output_message"])
+        duplicates = forks.project_items(db, project_id).filter(
+            models.DataItem.content_hash == content_hash
+        )
+        if on_conflict == "skip":
+            # skip: hand back the live duplicate untouched
+            existing = duplicates.filter(models.ProjectItem.deleted == False).first()
+            if existing:
+                response.headers["X-Data-Item-Result"] = "existing"
+                return existing
+        else:
+            # update: reuse a duplicate, reviving it if it was soft-deleted
+            existing = duplicates.order_by(models.ProjectItem.deleted).first()
+            if existing:
+                event_type = apply_item_update(db, existing, {**payload, "deleted": False})
+                if event_type:
+                    db.commit()
+                    db.refresh(existing)
+                    events.broker.publish(db, event_type, existing, project_id)
+                response.headers["X-Data-Item-Result"] = "updated" if event_type else "existing"
+                return existing
+
     db_data_item = models.DataItem(
         **data_item.model_dump(),
         project_id=project_id
     )
-    db.add(db_data_item)
+    db_project_item = forks.add_item(db, project_id, db_data_item)
     db.commit()
-    db.refresh(db_data_item)
-    return db_data_item
+    db.refresh(db_project_item)
+    events.broker.publish(db, "created", db_project_item, project_id)
+    return db_project_item
 
-@app.patch("/projects/{project_id}/data-items/{data_item_id}", response_model=schemas.DataItem)
+@app.get("/projects/{project_id}/data-items/sample", response_model=List[schemas.DataItem], dependencies=[Depends(ratelimit.limit("read"))])
+def sample_data_items(
+    project_id: UUID,
+    size: int = Query(100, ge=1, le=10000),
+    seed: int = 0,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Verify project ownership
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return sampling.sample(forks.project_items(db, project_id).filter(
+        models.ProjectItem.deleted == False
+    ), size, seed)
+
+@app.get("/projects/{project_id}/data-items/split/{split}", response_model=List[schemas.DataItem], dependencies=[Depends(ratelimit.limit("bulk"))])
+def list_split_data_items(
+    project_id: UUID,
+    split: Literal["train", "validation", "test"],
+    seed: int = 0,
+    train: float = 0.8,
+    validation: float = 0.1,
+    test: float = 0.1,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    ratios = {"train": train, "validation": validation, "test": test}
+    error = sampling.validate_ratios(ratios)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+
+    # Verify project ownership
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return sampling.filter_split(forks.project_items(db, project_id).filter(
+        models.ProjectItem.deleted == False
+    ), split, seed, ratios).all()
+
+@app.get("/projects/{project_id}/data-items/duplicates", response_model=schemas.DedupeReport, dependencies=[Depends(ratelimit.limit("bulk"))])
+def get_duplicate_report(
+    project_id: UUID,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Verify project ownership
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    live_items = forks.project_items(db, project_id).filter(
+        models.ProjectItem.deleted == False
+    )
+    total_items = live_items.count()
+
+    # Grouping on the indexed content_hash finds the duplicates
+    duplicate_hashes = live_items.with_entities(
+        models.DataItem.content_hash
+    ).group_by(models.DataItem.content_hash).having(func.count() > 1).subquery()
+
+    rows = live_items.with_entities(
+        models.DataItem.content_hash, models.ProjectItem.id
+    ).filter(
+        models.DataItem.content_hash.in_(duplicate_hashes.select())
+    ).order_by(models.DataItem.content_hash, models.DataItem.created_at).all()
+
+    groups = {}
+    for content_hash, item_id in rows:
+        groups.setdefault(content_hash, []).append(item_id)
+
+    return schemas.DedupeReport(
+        total_items=total_items,
+        duplicate_items=sum(len(ids) - 1 for ids in groups.values()),
+        groups=[
+            schemas.DuplicateGroup(content_hash=content_hash, count=len(ids), item_ids=ids)
+            for content_hash, ids in groups.items()
+        ]
+    )
+
+@app.patch("/projects/{project_id}/data-items/{data_item_id}", response_model=schemas.DataItem, dependencies=[Depends(ratelimit.limit("write"))])
 def update_data_item(
     project_id: UUID,
     data_item_id: UUID,
@@ -162,24 +383,24 @@ def update_data_item(
     current_user: models.User = Depends(get_current_user)
 ):
     # Verify project ownership and data item existence
-    db_data_item = db.query(models.DataItem).join(models.Project).filter(
-        models.DataItem.id == data_item_id,
-        models.DataItem.project_id == project_id,
+    db_project_item = forks.project_items(db, project_id).join(
+        models.Project, models.Project.id == models.ProjectItem.project_id
+    ).filter(
+        models.ProjectItem.id == data_item_id,
         models.Project.owner_id == current_user.id
     ).first()
 
-    if not db_data_item:
+    if not db_project_item:
         raise HTTPException(status_code=404, detail="Data item not found")
 
-    update_data = data_item_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_data_item, key, value)
-
-    db.commit()
-    db.refresh(db_data_item)
-    return db_data_item
+    event_type = apply_item_update(db, db_project_item, data_item_update.model_dump(exclude_unset=True))
+    if event_type:
+        db.commit()
+        db.refresh(db_project_item)
+        events.broker.publish(db, event_type, db_project_item, project_id)
+    return db_project_item
 
-@app.delete("/projects/{project_id}/data-items/{data_item_id}")
+@app.delete("/projects/{project_id}/data-items/{data_item_id}", dependencies=[Depends(ratelimit.limit("write"))])
 def delete_data_item(
     project_id: UUID,
     data_item_id: UUID,
@@ -187,15 +408,57 @@ def delete_data_item(
     current_user: models.User = Depends(get_current_user)
 ):
     # Verify project ownership and data item existence
-    db_data_item = db.query(models.DataItem).join(models.Project).filter(
-        models.DataItem.id == data_item_id,
-        models.DataItem.project_id == project_id,
+    db_project_item = forks.project_items(db, project_id).join(
+        models.Project, models.Project.id == models.ProjectItem.project_id
+    ).filter(
+        models.ProjectItem.id == data_item_id,
         models.Project.owner_id == current_user.id
     ).first()
 
-    if not db_data_item:
+    if not db_project_item:
         raise HTTPException(status_code=404, detail="Data item not found")
 
-    db_data_item.deleted = True
+    db_project_item.deleted = True
     db.commit()
+    events.broker.publish(db, "deleted", db_project_item, project_id)
     return {"message": "Data item soft-deleted"}
+
+@app.get("/projects/{project_id}/events", dependencies=[Depends(ratelimit.limit("read"))])
+async def stream_project_events(
+    project_id: UUID,
+    request: Request,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    def verify_ownership():
+        project = db.query(models.Project).filter(
+            models.Project.id == project_id,
+            models.Project.owner_id == current_user.id
+        ).first()
+        # Give the connection back to the pool, the stream can stay open for hours
+        db.close()
+        return project
+
+    # Blocking DB work stays off the event loop
+    if not await run_in_threadpool(verify_ownership):
+        raise HTTPException(status_code=404, detail="Project not found")
+    subscription = events.broker.subscribe(db, project_id)
+
+    async def event_stream():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,82 @@
+"""Binary encoding of message arrays ([{"type": ..., "content": ...}, ...]).
+
+Every encoded value starts with a format byte, so rows written in any format
+stay readable after the default changes:
+
+- ``[``  plain UTF-8 JSON, as the arrays were originally stored
+- 0x01  packed: message count, one type code per message, the character
+        length of each content, then all contents as a single UTF-8 string
+- 0x02  packed, zlib-compressed; only used when it actually saves space
+
+Packing drops the repeated "type"/"content" keys and decodes with one UTF-8
+decode and a slice per message, instead of a JSON parse.
+"""
+import json
+import struct
+import zlib
+from typing import List, Optional
+
+JSON = ord("[")
+PACKED = 0x01
+PACKED_ZLIB = 0x02
+
+TYPES = ("text", "image")
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+COMPRESS_MIN_SIZE = 256
+
+_count = struct.Struct("<I")
+
+
+def _pack(messages: List[dict]) -> bytes:
+    contents = [m["content"] for m in messages]
+    count = len(messages)
+    return b"".join((
+        _count.pack(count),
+        bytes(TYPE_CODES[m["type"]] for m in messages),
+        struct.pack(f"<{count}I", *(len(c) for c in contents)),
+        "".join(contents).encode("utf-8"),
+    ))
+
+
+def _unpack(body: bytes) -> List[dict]:
+    (count,) = _count.unpack_from(body)
+    offset = _count.size
+    types = body[offset:offset + count]
+    offset += count
+    lengths = struct.unpack_from(f"<{count}I", body, offset)
+    text = body[offset + 4 * count:].decode("utf-8")
+
+    messages = []
+    start = 0
+    for code, length in zip(types, lengths):
+        messages.append({"type": TYPES[code], "content": text[start:start + length]})
+        start += length
+    return messages
+
+
+def encode(messages: Optional[List[dict]], compact: bool = True) -> Optional[bytes]:
+    if messages is None:
+        return None
+    if not compact:
+        return json.dumps(messages, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    body = _pack(messages)
+    if len(body) >= COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            return bytes((PACKED_ZLIB,)) + compressed
+    return bytes((PACKED,)) + body
+
+
+def decode(value: Optional[bytes]) -> Optional[List[dict]]:
+    if value is None:
+        return None
+    value = bytes(value)
+    fmt = value[0]
+    if fmt == PACKED:
+        return _unpack(value[1:])
+    if fmt == PACKED_ZLIB:
+        return _unpack(zlib.decompress(value[1:]))
+    if fmt == JSON:
+        return json.loads(value)
+    raise ValueError(f"Unknown message encoding {fmt:#x}")
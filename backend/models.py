@@ -1,9 +1,69 @@
+import hashlib
+import json
+import os
 import uuid
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, JSON, UUID
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, JSON, UUID, Index, LargeBinary, event, inspect
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects import postgresql
 from database import Base
+import message_codec
 
+# "json" (default): JSONB columns, as before. "compact": binary columns written
+# with message_codec. The column type is set when migration d2a95c17e4f8 runs, so
+# switching an existing database means running that migration down and up again;
+# check_message_storage refuses to start against columns of the other kind.
+MESSAGE_STORAGES = ("json", "compact")
+MESSAGE_STORAGE = os.getenv("MESSAGE_STORAGE", "json")
+if MESSAGE_STORAGE not in MESSAGE_STORAGES:
+    raise ValueError(f"MESSAGE_STORAGE must be one of {MESSAGE_STORAGES}, not {MESSAGE_STORAGE!r}")
+
+
+class MessageArray(TypeDecorator):
+    """A list of {"type", "content"} messages, stored as JSON or with message_codec."""
+    impl = JSON
+    cache_ok = True
+
+    def __init__(self, storage: str = None):
+        super().__init__()
+        self.storage = storage or MESSAGE_STORAGE
+        if self.storage not in MESSAGE_STORAGES:
+            raise ValueError(f"Unknown message storage {self.storage!r}")
+
+    def load_dialect_impl(self, dialect):
+        if self.storage == "compact":
+            return dialect.type_descriptor(LargeBinary())
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.JSONB())
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if self.storage == "compact":
+            return message_codec.encode(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if self.storage == "compact":
+            return message_codec.decode(value)
+        return value
+
+
+def check_message_storage(engine):
+    """Raise if the migrated data_items columns don't match MESSAGE_STORAGE."""
+    if engine.dialect.name != "postgresql":
+        # Other databases (tests, local runs) get their schema from create_all
+        return
+    inspector = inspect(engine)
+    if not inspector.has_table("data_items"):
+        return
+    column = next(c for c in inspector.get_columns("data_items") if c["name"] == "input_message")
+    stored = "compact" if isinstance(column["type"], LargeBinary) else "json"
+    if stored != MESSAGE_STORAGE:
+        raise RuntimeError(
+            f"data_items stores messages as {stored} but MESSAGE_STORAGE is {MESSAGE_STORAGE!r}; "
+            "set it to match, or rerun migration d2a95c17e4f8 with the new value"
+        )
 
 
 class User(Base):
@@ -21,21 +81,98 @@ class Project(Base):
     name = Column(String, nullable=False)
     deleted = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    forked_from_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     owner = relationship("User", back_populates="projects")
     data_items = relationship("DataItem", back_populates="project")
+    stats = relationship("ProjectStats", back_populates="project", uselist=False)
 
 class DataItem(Base):
+    """The stored content of a data item. Projects reach it through project_items."""
     __tablename__ = "data_items"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # The project that created the row. Which projects show it is in project_items.
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), nullable=False)
-    input_message = Column(JSON, nullable=False)
-    output_message = Column(JSON, nullable=True)
+    input_message = Column(MessageArray, nullable=False)
+    output_message = Column(MessageArray, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    deleted = Column(Boolean, default=False)
+    # sha256 of the canonical JSON of both message arrays, see compute_content_hash
+    content_hash = Column(String(64), nullable=True)
 
     project = relationship("Project", back_populates="data_items")
+
+    __table_args__ = (
+        Index("ix_data_items_content_hash", "content_hash"),
+    )
+
+
+def _stored(name):
+    return property(lambda self: getattr(self.data_item, name))
+
+
+class ProjectItem(Base):
+    """A data item as a project shows it; forks share rows through it (see forks.py).
+
+    The API serves these: ``id`` is the item's public id, and the content is read
+    from whichever data_items row the item currently points at.
+    """
+    __tablename__ = "project_items"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), primary_key=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    data_item_id = Column(UUID(as_uuid=True), ForeignKey("data_items.id"), nullable=False, index=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+
+    # active_history keeps the previous row around when repointed, for stats.py
+    data_item = relationship("DataItem", active_history=True)
+
+    input_message = _stored("input_message")
+    output_message = _stored("output_message")
+    created_at = _stored("created_at")
+    updated_at = _stored("updated_at")
+    content_hash = _stored("content_hash")
+
+
+class ProjectStats(Base):
+    """Running aggregates over a project's live data items, maintained by stats.py."""
+    __tablename__ = "project_stats"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0)
+    items_with_output = Column(Integer, nullable=False, default=0)
+    text_messages = Column(Integer, nullable=False, default=0)
+    image_messages = Column(Integer, nullable=False, default=0)
+    text_length_total = Column(BigInteger, nullable=False, default=0)
+    token_total = Column(BigInteger, nullable=False, default=0)
+    # Log-bucketed histograms, {bucket: count}; see stats.bucket_of
+    length_histogram = Column(JSON, nullable=False, default=dict)
+    token_histogram = Column(JSON, nullable=False, default=dict)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    project = relationship("Project", back_populates="stats")
+
+
+def compute_content_hash(input_message, output_message) -> str:
+    # Only the fields of schemas.MessageItem take part, in a fixed key order, so the
+    # same messages always hash the same regardless of how the client sent them.
+    def normalize(messages):
+        if messages is None:
+            return None
+        return [{"type": m["type"], "content": m["content"]} for m in messages]
+
+    canonical = json.dumps(
+        [normalize(input_message), normalize(output_message)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@event.listens_for(DataItem, "before_insert")
+@event.listens_for(DataItem, "before_update")
+def _set_content_hash(mapper, connection, target):
+    target.content_hash = compute_content_hash(target.input_message, target.output_message)
@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Header, HTTPException
+
+
+def _parse_limit(value: str) -> Tuple[float, int]:
+    # "<tokens per second>/<burst>", e.g. "20/100"
+    rate, burst = value.split("/")
+    return float(rate), int(burst)
+
+
+# Per route class token bucket settings, overridable through the environment
+ROUTE_CLASSES: Dict[str, Tuple[float, int]] = {
+    "read": _parse_limit(os.getenv("RATE_LIMIT_READ", "50/200")),
+    "write": _parse_limit(os.getenv("RATE_LIMIT_WRITE", "20/100")),
+    "bulk": _parse_limit(os.getenv("RATE_LIMIT_BULK", "1/5")),
+}
+
+# Keep this at or below the DB pool capacity (pool_size + max_overflow, 5 + 10 by
+# default) so excess requests are turned away instead of waiting for a connection.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "15"))
+# How often MemoryStore drops buckets that have refilled completely
+SWEEP_INTERVAL = 60.0
+
+
+class MemoryStore:
+    """Token buckets held in process memory.
+
+    A store only needs ``take``; a shared implementation (Redis, Postgres) with
+    the same signature can be assigned to ``limiter.store`` to enforce limits
+    across several backend nodes.
+
+    Keys come from an unverified header, so a full bucket is never kept: it is
+    the same as no bucket at all, and a periodic sweep drops it. Memory then
+    only grows with the keys seen in the last few seconds.
+    """
+
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        # key -> (tokens, updated, rate, burst)
+        self._buckets: Dict[str, Tuple[float, float, float, int]] = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._last_sweep: Optional[float] = None
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        """Take one token from the bucket; return 0 on success, else seconds until one is available."""
+        with self._lock:
+            self._maybe_sweep(now)
+            tokens, updated, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, rate, burst)
+                return 0
+            self._buckets[key] = (tokens, now, rate, burst)
+            return (1 - tokens) / rate
+
+    def _maybe_sweep(self, now: float):
+        if self._last_sweep is None:
+            self._last_sweep = now
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+
+class RateLimiter:
+    def __init__(self, store=None, route_classes: Optional[Dict[str, Tuple[float, int]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.store = store or MemoryStore()
+        self.route_classes = route_classes or ROUTE_CLASSES
+        self.clock = clock
+
+    def check(self, user_key: str, route_class: str):
+        rate, burst = self.route_classes[route_class]
+        retry_after = self.store.take(f"{route_class}:{user_key}", rate, burst, self.clock())
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+
+limiter = RateLimiter()
+
+
+def limit(route_class: str, rate_limiter: Optional[RateLimiter] = None):
+    """Build a route dependency charging one token to the caller's bucket for ``route_class``."""
+
+    def dependency(x_logto_user: Optional[str] = Header(None, alias="X-Logto-User")):
+        # Key on the same identity get_current_user resolves, but without touching
+        # the database so rejected requests never take a connection.
+        (rate_limiter or limiter).check(x_logto_user or "test_user_id", route_class)
+
+    return dependency
+
+
+class ConcurrencyLimitMiddleware:
+    """Reject requests with 503 once ``max_concurrent`` are already in flight.
+
+    Paths matched by ``streaming`` are long-lived responses that give their
+    database connection back before they start responding. They count until
+    the response starts, so their auth and setup queries are capped like any
+    other request, and then they stop counting.
+    """
+
+    def __init__(self, app, max_concurrent: int = MAX_CONCURRENT_REQUESTS, streaming: Callable[[str], bool] = None):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.streaming = streaming or (lambda path: False)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with self._lock:
+            admitted = self.in_flight < self.max_concurrent
+            if admitted:
+                self.in_flight += 1
+        if not admitted:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": json.dumps({"detail": "Server busy"}).encode()})
+            return
+
+        released = False
+        if self.streaming(scope["path"]):
+            inner_send = send
+
+            async def send(message):
+                nonlocal released
+                if message["type"] == "http.response.start" and not released:
+                    released = True
+                    self._release()
+                await inner_send(message)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if not released:
+                self._release()
@@ -0,0 +1,119 @@
+"""Reproducible samples and train/validation/test splits of a project's data items.
+
+Item ids (project_items.id) are random UUID4s, so their top 48 bits are
+uniformly distributed and independent of the content. A seed picks points on
+that 48-bit ring, and samples and splits are contiguous arcs of it. Each arc
+turns into an id range predicate served by the (project_id, id) primary key of
+project_items. A 1% split therefore reads about 1% of the project's rows, and
+an N item sample reads about N rows. Queries passed in must come from
+forks.project_items. An item keeps its id through edits and forks, so it
+stays in the same split.
+"""
+import hashlib
+import math
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, false, or_
+from sqlalchemy.orm import Query
+
+import models
+
+RING_BITS = 48
+RING_SIZE = 1 << RING_BITS
+SPLITS = ("train", "validation", "test")
+
+
+def _ring_hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.sha256(data).digest()[:RING_BITS // 8], "big")
+
+
+def seed_offset(seed: int) -> int:
+    """Where the seed's train split starts."""
+    return _ring_hash(str(seed).encode())
+
+
+def sample_offset(seed: int) -> int:
+    # Hashed separately, so a sample does not start where the train split starts
+    return _ring_hash(b"sample:" + str(seed).encode())
+
+
+def ring_position(item_id: UUID) -> int:
+    return item_id.int >> (128 - RING_BITS)
+
+
+def _bound(position: int) -> UUID:
+    return UUID(int=position << (128 - RING_BITS))
+
+
+def _arc_ranges(start: int, end: int) -> List[Tuple[int, int]]:
+    # Arc [start, end) on the ring, split in two where it wraps past zero
+    if start >= RING_SIZE:
+        start, end = start - RING_SIZE, end - RING_SIZE
+    if end <= RING_SIZE:
+        return [(start, end)]
+    return [(start, RING_SIZE), (0, end - RING_SIZE)]
+
+
+def _range_filter(lo: int, hi: int):
+    conditions = [models.ProjectItem.id >= _bound(lo)]
+    if hi < RING_SIZE:
+        conditions.append(models.ProjectItem.id < _bound(hi))
+    return and_(*conditions)
+
+
+def split_arcs(seed: int, ratios: Dict[str, float]) -> Dict[str, List[Tuple[int, int]]]:
+    """Assign each split a share of the ring proportional to its ratio."""
+    start = seed_offset(seed)
+    arcs = {}
+    cumulative = 0.0
+    lo = start
+    for index, name in enumerate(SPLITS):
+        cumulative += ratios[name]
+        # The last split closes the ring exactly, whatever the float rounding
+        hi = start + RING_SIZE if index == len(SPLITS) - 1 else start + round(cumulative * RING_SIZE)
+        arcs[name] = _arc_ranges(lo, hi)
+        lo = hi
+    return arcs
+
+
+def assign_split(item_id: UUID, seed: int, ratios: Dict[str, float]) -> str:
+    position = ring_position(item_id)
+    for name, ranges in split_arcs(seed, ratios).items():
+        for lo, hi in ranges:
+            if lo <= position < hi:
+                return name
+    raise AssertionError("split arcs must cover the whole ring")
+
+
+def filter_split(query: Query, split: str, seed: int, ratios: Dict[str, float]) -> Query:
+    ranges = [(lo, hi) for lo, hi in split_arcs(seed, ratios)[split] if lo < hi]
+    if not ranges:
+        return query.filter(false())
+    return query.filter(or_(*(_range_filter(lo, hi) for lo, hi in ranges)))
+
+
+def sample(query: Query, size: int, seed: int) -> List[models.ProjectItem]:
+    """The first ``size`` items clockwise from the seed's sample point on the ring.
+
+    This is a window sample rather than a uniform one. Items are placed on the
+    ring at random, so every item is equally likely to be picked across seeds.
+    For a given seed, though, neighbouring items tend to be picked together, and
+    samples for the same seed with different sizes are nested.
+    """
+    start = _bound(sample_offset(seed))
+    position = models.ProjectItem.id
+    items = query.filter(position >= start).order_by(position).limit(size).all()
+    if len(items) < size:
+        items += query.filter(position < start).order_by(position).limit(size - len(items)).all()
+    return items
+
+
+def validate_ratios(ratios: Dict[str, float]) -> Optional[str]:
+    if not all(math.isfinite(ratio) for ratio in ratios.values()):
+        return "Split ratios must be finite numbers"
+    if any(ratio < 0 for ratio in ratios.values()):
+        return "Split ratios must not be negative"
+    if abs(sum(ratios.values()) - 1) > 1e-9:
+        return "Split ratios must add up to 1"
+    return None
@@ -21,6 +21,9 @@ class ProjectBase(BaseModel):
 class ProjectCreate(ProjectBase):
     pass
 
+class ProjectFork(BaseModel):
+    name: Optional[str] = None
+
 class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     deleted: Optional[bool] = None
@@ -28,6 +31,7 @@ class ProjectUpdate(BaseModel):
 class Project(ProjectBase):
     id: UUID4
     owner_id: int
+    forked_from_id: Optional[UUID4] = None
     deleted: bool = False
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
@@ -58,6 +62,42 @@ class DataItem(DataItemBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     deleted: bool
+    content_hash: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class DuplicateGroup(BaseModel):
+    content_hash: str
+    count: int
+    item_ids: List[UUID4]
+
+class DedupeReport(BaseModel):
+    total_items: int
+    duplicate_items: int
+    groups: List[DuplicateGroup]
+
+
+class HistogramBucket(BaseModel):
+    lower: int
+    upper: int
+    count: int
+
+class Distribution(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    # Quantiles are estimated from the histogram, within about 4.3% of the true value
+    p50: Optional[int] = None
+    p90: Optional[int] = None
+    p99: Optional[int] = None
+    histogram: List[HistogramBucket]
+
+class ProjectStats(BaseModel):
+    project_id: UUID4
+    item_count: int
+    items_with_output: int
+    items_without_output: int
+    text_messages: int
+    image_messages: int
+    message_length: Distribution
+    token_estimate: Distribution
+    updated_at: Optional[datetime] = None
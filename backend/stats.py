@@ -0,0 +1,279 @@
+"""Incrementally maintained per-project dataset statistics.
+
+Every flush that adds, deletes, restores or repoints a project's item, or edits
+a DataItem in place, turns the change into a contribution delta and adds it to
+each affected project's ProjectStats row, so reading stats never touches
+data_items. Distributions are
+DDSketch-style histograms: log buckets with gamma = 2^(1/8), kept as plain
+counters so deletes and edits subtract exactly. Quantiles come back within
+about 4.3% of the true value.
+"""
+import math
+from collections import Counter
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models, schemas
+
+COUNTERS = ("item_count", "items_with_output", "text_messages", "image_messages", "text_length_total", "token_total")
+HISTOGRAMS = ("length_histogram", "token_histogram")
+BUCKETS_PER_DOUBLING = 8
+GAMMA = 2 ** (1 / BUCKETS_PER_DOUBLING)
+MAX_BUCKET = 40 * BUCKETS_PER_DOUBLING + 1
+CHARS_PER_TOKEN = 4
+
+
+def bucket_of(value: int) -> int:
+    # 0 -> 0; bucket b >= 1 holds values in [GAMMA^(b-1), GAMMA^b)
+    if value <= 0:
+        return 0
+    return min(1 + math.floor(math.log2(value) * BUCKETS_PER_DOUBLING), MAX_BUCKET)
+
+
+def _lowest_value(bucket: int) -> int:
+    value = max(1, math.ceil(GAMMA ** (bucket - 1)))
+    # Step past float rounding so the bounds always agree with bucket_of
+    while bucket_of(value) < bucket:
+        value += 1
+    while value > 1 and bucket_of(value - 1) >= bucket:
+        value -= 1
+    return value
+
+
+def bucket_bounds(bucket: int):
+    if bucket == 0:
+        return 0, 0
+    return _lowest_value(bucket), _lowest_value(bucket + 1) - 1
+
+
+def bucket_value(bucket: int) -> int:
+    """DDSketch's estimate for a bucket, which keeps the relative error under (GAMMA-1)/(GAMMA+1)."""
+    if bucket == 0:
+        return 0
+    lower, upper = bucket_bounds(bucket)
+    return min(upper, max(lower, round(2 * GAMMA ** bucket / (GAMMA + 1))))
+
+
+def estimate_tokens(length: int) -> int:
+    return -(-length // CHARS_PER_TOKEN)
+
+
+def contribution(input_message, output_message, deleted) -> Counter:
+    """What a single data item adds to its project's stats."""
+    delta = Counter()
+    if deleted or input_message is None:
+        return delta
+
+    delta["item_count"] = 1
+    if output_message:
+        delta["items_with_output"] = 1
+
+    tokens = 0
+    for message in list(input_message) + list(output_message or []):
+        if message["type"] == "image":
+            delta["image_messages"] += 1
+            continue
+        length = len(message["content"])
+        delta["text_messages"] += 1
+        delta["text_length_total"] += length
+        delta[("length_histogram", bucket_of(length))] += 1
+        tokens += estimate_tokens(length)
+    delta["token_total"] = tokens
+    delta[("token_histogram", bucket_of(tokens))] += 1
+    return delta
+
+
+def apply_delta(project_stats: models.ProjectStats, delta: Counter):
+    for name in COUNTERS:
+        if delta[name]:
+            setattr(project_stats, name, (getattr(project_stats, name) or 0) + delta[name])
+    for name in HISTOGRAMS:
+        histogram = dict(getattr(project_stats, name) or {})
+        changed = False
+        for key, count in delta.items():
+            if isinstance(key, tuple) and key[0] == name and count:
+                bucket = str(key[1])
+                histogram[bucket] = histogram.get(bucket, 0) + count
+                if histogram[bucket] == 0:
+                    del histogram[bucket]
+                changed = True
+        if changed:
+            # Assign a new dict so the JSON column is flagged as modified
+            setattr(project_stats, name, histogram)
+
+
+def rebuild(db: Session, project_id: UUID) -> models.ProjectStats:
+    """Recompute a project's stats from scratch with a single pass over its items."""
+    delta = Counter()
+    rows = db.query(models.DataItem.input_message, models.DataItem.output_message).join(
+        models.ProjectItem, models.ProjectItem.data_item_id == models.DataItem.id
+    ).filter(
+        models.ProjectItem.project_id == project_id,
+        models.ProjectItem.deleted == False
+    ).yield_per(1000)
+    for input_message, output_message in rows:
+        delta.update(contribution(input_message, output_message, False))
+
+    project_stats = db.get(models.ProjectStats, project_id)
+    if project_stats is None:
+        project_stats = models.ProjectStats(project_id=project_id)
+        db.add(project_stats)
+    for name in COUNTERS:
+        setattr(project_stats, name, 0)
+    for name in HISTOGRAMS:
+        setattr(project_stats, name, {})
+    apply_delta(project_stats, delta)
+    return project_stats
+
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def lock_stats(db: Session, project_id: UUID) -> models.ProjectStats:
+    """Lock the project's stats row until the end of the transaction, creating it if needed."""
+    # INSERT ... ON CONFLICT DO NOTHING first, so there is always a row to lock and
+    # concurrent first writers to a project queue up on it instead of colliding.
+    insert = _INSERTS[db.get_bind().dialect.name]
+    created = db.execute(
+        insert(models.ProjectStats.__table__).values(project_id=project_id).on_conflict_do_nothing()
+    ).rowcount == 1
+    project_stats = db.query(models.ProjectStats).filter(
+        models.ProjectStats.project_id == project_id
+    ).with_for_update().populate_existing().one()
+    if created:
+        # Projects that predate the stats table start with a full rebuild
+        rebuild(db, project_id)
+    return project_stats
+
+
+def get_project_stats(db: Session, project_id: UUID) -> models.ProjectStats:
+    project_stats = db.get(models.ProjectStats, project_id)
+    if project_stats is None:
+        project_stats = lock_stats(db, project_id)
+        db.commit()
+    return project_stats
+
+
+def _previous(obj, name):
+    """The attribute's value as last loaded from the database."""
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return None
+    return getattr(obj, name)
+
+
+def _contribution(db_project_item: models.ProjectItem, previous: bool = False) -> Counter:
+    if not previous:
+        row = db_project_item.data_item
+        return contribution(row.input_message, row.output_message, db_project_item.deleted)
+    row = _previous(db_project_item, "data_item")
+    if row is None:
+        return Counter()
+    return contribution(
+        _previous(row, "input_message"),
+        _previous(row, "output_message"),
+        _previous(db_project_item, "deleted")
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _track_data_item_changes(session: Session, flush_context, instances):
+    deltas: Dict[UUID, Counter] = {}
+    handled = set()
+
+    def add(project_id, delta):
+        delta = Counter({key: count for key, count in delta.items() if count})
+        if delta:
+            deltas.setdefault(project_id, Counter()).update(delta)
+
+    with session.no_autoflush:
+        # An item's contribution moves with its project_items row: added, removed,
+        # soft-deleted or restored, or repointed at a copy of its content...
+        for obj in session.new:
+            if isinstance(obj, models.ProjectItem):
+                add(obj.project_id, _contribution(obj))
+        for obj in session.deleted:
+            if isinstance(obj, models.ProjectItem):
+                delta = Counter()
+                delta.subtract(_contribution(obj, previous=True))
+                add(obj.project_id, delta)
+        for obj in session.dirty:
+            if isinstance(obj, models.ProjectItem) and session.is_modified(obj):
+                handled.add((obj.project_id, obj.id))
+                delta = _contribution(obj)
+                delta.subtract(_contribution(obj, previous=True))
+                add(obj.project_id, delta)
+
+        # ...and an in-place edit of a DataItem moves every live item showing it
+        for obj in session.dirty:
+            if not isinstance(obj, models.DataItem):
+                continue
+            delta = contribution(obj.input_message, obj.output_message, False)
+            delta.subtract(contribution(
+                _previous(obj, "input_message"), _previous(obj, "output_message"), False
+            ))
+            if not any(delta.values()):
+                continue
+            items = session.query(models.ProjectItem.project_id, models.ProjectItem.id).filter(
+                models.ProjectItem.data_item_id == obj.id,
+                models.ProjectItem.deleted == False
+            ).all()
+            for project_id, item_id in items:
+                if (project_id, item_id) not in handled:
+                    add(project_id, delta)
+
+        for project_id, delta in deltas.items():
+            # Concurrent writers to the same project serialize on this lock. A newly
+            # created row is rebuilt from the database before this flush is added.
+            apply_delta(lock_stats(session, project_id), delta)
+
+
+def _quantile(histogram: Dict[str, int], total: int, q: float) -> Optional[int]:
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_value(int(bucket))
+    return bucket_value(max(int(b) for b in histogram))
+
+
+def _distribution(histogram: Dict[str, int], total_value: int) -> schemas.Distribution:
+    count = sum(histogram.values())
+    return schemas.Distribution(
+        count=count,
+        mean=total_value / count if count else None,
+        p50=_quantile(histogram, count, 0.5),
+        p90=_quantile(histogram, count, 0.9),
+        p99=_quantile(histogram, count, 0.99),
+        histogram=[
+            schemas.HistogramBucket(
+                lower=bucket_bounds(int(bucket))[0],
+                upper=bucket_bounds(int(bucket))[1],
+                count=histogram[bucket]
+            )
+            for bucket in sorted(histogram, key=int)
+        ]
+    )
+
+
+def to_schema(project_stats: models.ProjectStats) -> schemas.ProjectStats:
+    return schemas.ProjectStats(
+        project_id=project_stats.project_id,
+        item_count=project_stats.item_count,
+        items_with_output=project_stats.items_with_output,
+        items_without_output=project_stats.item_count - project_stats.items_with_output,
+        text_messages=project_stats.text_messages,
+        image_messages=project_stats.image_messages,
+        message_length=_distribution(project_stats.length_histogram or {}, project_stats.text_length_total),
+        token_estimate=_distribution(project_stats.token_histogram or {}, project_stats.token_total),
+        updated_at=project_stats.updated_at
+    )
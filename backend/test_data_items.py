@@ -6,6 +6,8 @@ from database import get_db, Base
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import models
+import ratelimit
+import stats
 import uuid
 
 # --- Test DB Setup ---
@@ -24,8 +26,14 @@ app.dependency_overrides[get_db] = override_get_db
 
 client = TestClient(app)
 
+def app_db():
+    # A session on whatever database the app is currently wired to
+    return next(app.dependency_overrides[get_db]())
+
 @pytest.fixture(autouse=True)
 def setup_db():
+    # Fresh rate limit buckets so earlier tests don't eat into this one's budget
+    ratelimit.limiter.store = ratelimit.MemoryStore()
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
@@ -105,3 +113,647 @@ def test_soft_delete_data_item():
     # Verify not in list
     list_resp = client.get(f"/projects/{project_id}/data-items/", headers={"X-Logto-User": "user1"})
     assert len(list_resp.json()) == 0
+
+def test_data_item_events_are_published():
+    import asyncio
+    import events
+
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    async def collect():
+        db = TestingSessionLocal()
+        subscription = events.broker.subscribe(db, uuid.UUID(project_id))
+        db.close()
+        try:
+            item = client.post(f"/projects/{project_id}/data-items/", json={
+                "input_message": [{"type": "text", "content": "Live"}]
+            }, headers={"X-Logto-User": "user1"}).json()
+            client.patch(f"/projects/{project_id}/data-items/{item['id']}", json={
+                "output_message": [{"type": "text", "content": "Reply"}]
+            }, headers={"X-Logto-User": "user1"})
+            client.delete(f"/projects/{project_id}/data-items/{item['id']}", headers={"X-Logto-User": "user1"})
+            return item, [await asyncio.wait_for(subscription.queue.get(), timeout=1) for _ in range(3)]
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    item, received = asyncio.run(collect())
+    assert [e["type"] for e in received] == ["created", "updated", "deleted"]
+    assert all(e["item_id"] == item["id"] for e in received)
+    assert received[0]["item"]["input_message"][0]["content"] == "Live"
+    assert received[1]["item"]["output_message"][0]["content"] == "Reply"
+    assert received[2]["item"] is None
+
+def test_data_item_events_stay_within_project():
+    import asyncio
+    import events
+
+    project_a = client.post("/projects/", json={"name": "A"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    project_b = client.post("/projects/", json={"name": "B"}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    async def collect():
+        db = TestingSessionLocal()
+        subscription = events.broker.subscribe(db, uuid.UUID(project_a))
+        db.close()
+        try:
+            client.post(f"/projects/{project_b}/data-items/", json={
+                "input_message": [{"type": "text", "content": "Other"}]
+            }, headers={"X-Logto-User": "user1"})
+            await asyncio.sleep(0.05)
+            return subscription.queue.qsize()
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    assert asyncio.run(collect()) == 0
+
+def test_project_events_stream_sends_sse_frames():
+    import asyncio
+    import json
+
+    project_id = client.post("/projects/", json={"name": "Live"}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    async def read_stream():
+        # TestClient buffers whole responses, so drive the ASGI app directly
+        disconnected = asyncio.Event()
+        body = []
+        received = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                body.append(message["status"])
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b"").decode())
+            received.set()
+
+        path = f"/projects/{project_id}/events"
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"x-logto-user", b"user1")], "client": ("testclient", 50000), "server": ("testserver", 80),
+        }
+        task = asyncio.create_task(app(scope, receive, send))
+
+        async def wait_for(text):
+            while not any(isinstance(chunk, str) and text in chunk for chunk in body):
+                received.clear()
+                await asyncio.wait_for(received.wait(), timeout=5)
+
+        await wait_for(": connected")
+        item = (await asyncio.to_thread(
+            client.post, f"/projects/{project_id}/data-items/",
+            json={"input_message": [{"type": "text", "content": "Streamed"}]}, headers={"X-Logto-User": "user1"}
+        )).json()
+        await wait_for("event: created")
+
+        disconnected.set()
+        await asyncio.wait_for(task, timeout=5)
+        return body, item
+
+    body, item = asyncio.run(read_stream())
+    assert body[0] == 200
+    frame = next(chunk for chunk in body[1:] if "event: created" in chunk)
+    event_line, data_line = frame.strip().split("\n")
+    assert event_line == "event: created"
+    event = json.loads(data_line[len("data: "):])
+    assert event["item_id"] == item["id"]
+    assert event["item"]["input_message"][0]["content"] == "Streamed"
+
+def test_event_listener_reconnects_and_resyncs(monkeypatch):
+    import asyncio
+    import events
+
+    class Stop(BaseException):
+        pass
+
+    class FakeConnection:
+        def __init__(self):
+            self.dbapi_connection = self
+        def cursor(self):
+            return self
+        def execute(self, sql):
+            pass
+        def invalidate(self):
+            pass
+
+    attempts = []
+    def raw_connection():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("database restarting")
+        return FakeConnection()
+
+    def receive(pg_connection):
+        # First session drops, the second one ends the test
+        if len(attempts) == 2:
+            raise ConnectionError("connection lost")
+        raise Stop()
+
+    broker = events.EventBroker()
+    monkeypatch.setattr(events.database.engine, "raw_connection", raw_connection)
+    monkeypatch.setattr(events.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(broker, "_receive", receive)
+
+    async def run():
+        db = TestingSessionLocal()
+        subscription = broker.subscribe(db, uuid.uuid4())
+        db.close()
+        with pytest.raises(Stop):
+            broker._listen()
+        await asyncio.sleep(0)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+    received = asyncio.run(run())
+    assert len(attempts) == 3
+    assert [e["type"] for e in received] == ["resync", "resync"]
+
+def test_project_events_stream_requires_ownership():
+    project_id = client.post("/projects/", json={"name": "Private"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    resp = client.get(f"/projects/{project_id}/events", headers={"X-Logto-User": "user2"})
+    assert resp.status_code == 404
+
+def test_content_hash_ignores_key_order():
+    a = models.compute_content_hash([{"type": "text", "content": "Hi"}], None)
+    b = models.compute_content_hash([{"content": "Hi", "type": "text"}], None)
+    assert a == b
+    assert a != models.compute_content_hash([{"type": "text", "content": "Hi"}], [])
+
+def test_create_data_item_on_conflict():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    payload = {"input_message": [{"type": "text", "content": "Same"}]}
+
+    resp = client.post(f"/projects/{project_id}/data-items/?on_conflict=skip", json=payload, headers={"X-Logto-User": "user1"})
+    assert resp.headers["X-Data-Item-Result"] == "created"
+    first = resp.json()
+    resp = client.post(f"/projects/{project_id}/data-items/?on_conflict=skip", json=payload, headers={"X-Logto-User": "user1"})
+    assert resp.headers["X-Data-Item-Result"] == "existing"
+    skipped = resp.json()
+    assert skipped["id"] == first["id"]
+    assert skipped["content_hash"] == first["content_hash"]
+
+    # Without on_conflict duplicates are still accepted
+    plain = client.post(f"/projects/{project_id}/data-items/", json=payload, headers={"X-Logto-User": "user1"}).json()
+    assert plain["id"] != first["id"]
+
+    # update revives a soft-deleted duplicate instead of inserting
+    client.delete(f"/projects/{project_id}/data-items/{first['id']}", headers={"X-Logto-User": "user1"})
+    client.delete(f"/projects/{project_id}/data-items/{plain['id']}", headers={"X-Logto-User": "user1"})
+    resp = client.post(f"/projects/{project_id}/data-items/?on_conflict=update", json=payload, headers={"X-Logto-User": "user1"})
+    assert resp.headers["X-Data-Item-Result"] == "updated"
+    updated = resp.json()
+    assert updated["id"] in (first["id"], plain["id"])
+    assert updated["deleted"] is False
+
+    resp = client.get(f"/projects/{project_id}/data-items/", headers={"X-Logto-User": "user1"})
+    assert len(resp.json()) == 1
+
+    # Updating with the very same content changes nothing
+    resp = client.post(f"/projects/{project_id}/data-items/?on_conflict=update", json=payload, headers={"X-Logto-User": "user1"})
+    assert resp.headers["X-Data-Item-Result"] == "existing"
+
+def test_update_data_item_refreshes_content_hash():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    item = client.post(f"/projects/{project_id}/data-items/", json={
+        "input_message": [{"type": "text", "content": "Before"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+
+    updated = client.patch(f"/projects/{project_id}/data-items/{item['id']}", json={
+        "input_message": [{"type": "text", "content": "After"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert updated["content_hash"] == models.compute_content_hash([{"type": "text", "content": "After"}], None)
+
+def test_duplicate_report():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    for content in ["A", "A", "A", "B", "C", "C"]:
+        client.post(f"/projects/{project_id}/data-items/", json={
+            "input_message": [{"type": "text", "content": content}]
+        }, headers={"X-Logto-User": "user1"})
+
+    resp = client.get(f"/projects/{project_id}/data-items/duplicates", headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["total_items"] == 6
+    assert report["duplicate_items"] == 3
+    assert sorted(g["count"] for g in report["groups"]) == [2, 3]
+
+    resp = client.get(f"/projects/{project_id}/data-items/duplicates", headers={"X-Logto-User": "user2"})
+    assert resp.status_code == 404
+
+def test_project_stats_incremental():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    resp = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 200
+    assert resp.json()["item_count"] == 0
+    assert resp.json()["message_length"]["p50"] is None
+
+    a = client.post(f"/projects/{project_id}/data-items/", json={
+        "input_message": [{"type": "text", "content": "abcd"}, {"type": "image", "content": "http://img"}],
+        "output_message": [{"type": "text", "content": "abcdefgh"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    b = client.post(f"/projects/{project_id}/data-items/", json={
+        "input_message": [{"type": "text", "content": "x"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+
+    data = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user1"}).json()
+    assert data["item_count"] == 2
+    assert data["items_with_output"] == 1
+    assert data["items_without_output"] == 1
+    assert data["text_messages"] == 3
+    assert data["image_messages"] == 1
+    assert data["message_length"]["count"] == 3
+    assert data["message_length"]["mean"] == 13 / 3
+    assert data["token_estimate"]["count"] == 2
+
+    client.patch(f"/projects/{project_id}/data-items/{b['id']}", json={
+        "output_message": [{"type": "image", "content": "http://img2"}]
+    }, headers={"X-Logto-User": "user1"})
+    client.delete(f"/projects/{project_id}/data-items/{a['id']}", headers={"X-Logto-User": "user1"})
+
+    data = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user1"}).json()
+    assert data["item_count"] == 1
+    assert data["items_with_output"] == 1
+    assert data["text_messages"] == 1
+    assert data["image_messages"] == 1
+    assert data["message_length"]["histogram"] == [{"lower": 1, "upper": 1, "count": 1}]
+
+    rebuilt = client.post(f"/projects/{project_id}/stats/rebuild", headers={"X-Logto-User": "user1"}).json()
+    assert {k: v for k, v in rebuilt.items() if k != "updated_at"} == {k: v for k, v in data.items() if k != "updated_at"}
+
+def test_project_stats_rebuilt_when_missing():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    for content in ["one", "two", "three"]:
+        client.post(f"/projects/{project_id}/data-items/", json={
+            "input_message": [{"type": "text", "content": content}]
+        }, headers={"X-Logto-User": "user1"})
+
+    # Simulate a project that predates the stats table
+    db = app_db()
+    db.query(models.ProjectStats).delete()
+    db.commit()
+    assert db.get(models.ProjectStats, uuid.UUID(project_id)) is None
+    db.close()
+
+    data = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user1"}).json()
+    assert data["item_count"] == 3
+    assert data["message_length"]["p99"] == 5
+
+    db = app_db()
+    assert db.get(models.ProjectStats, uuid.UUID(project_id)).item_count == 3
+    db.close()
+
+def test_project_stats_row_created_with_project():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    db = app_db()
+    assert db.get(models.ProjectStats, uuid.UUID(project_id)).item_count == 0
+    db.close()
+
+def test_stats_quantiles_within_relative_error():
+    for value in list(range(1, 2000)) + [10 ** 6, 123456789]:
+        bucket = stats.bucket_of(value)
+        lower, upper = stats.bucket_bounds(bucket)
+        assert lower <= value <= upper
+        # Relative error of (GAMMA-1)/(GAMMA+1), about 4.3%, plus rounding to an integer
+        alpha = (stats.GAMMA - 1) / (stats.GAMMA + 1)
+        assert abs(stats.bucket_value(bucket) - value) <= alpha * value + 1
+
+    lengths = [3, 17, 17, 250, 900, 4000, 12000]
+    histogram = {}
+    for length in lengths * 100:
+        bucket = str(stats.bucket_of(length))
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    distribution = stats._distribution(histogram, sum(lengths) * 100)
+    assert abs(distribution.p50 - 250) <= 0.05 * 250
+    assert abs(distribution.p99 - 12000) <= 0.05 * 12000
+
+def test_project_stats_ownership():
+    project_id = client.post("/projects/", json={"name": "Private"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    resp = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user2"})
+    assert resp.status_code == 404
+
+def _create_items(project_id, count):
+    return [
+        client.post(f"/projects/{project_id}/data-items/", json={
+            "input_message": [{"type": "text", "content": f"Item {i}"}]
+        }, headers={"X-Logto-User": "user1"}).json()["id"]
+        for i in range(count)
+    ]
+
+def test_sample_data_items_is_reproducible():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    item_ids = _create_items(project_id, 30)
+
+    url = f"/projects/{project_id}/data-items/sample"
+    first = [i["id"] for i in client.get(url, params={"size": 10, "seed": 7}, headers={"X-Logto-User": "user1"}).json()]
+    again = [i["id"] for i in client.get(url, params={"size": 10, "seed": 7}, headers={"X-Logto-User": "user1"}).json()]
+    other = [i["id"] for i in client.get(url, params={"size": 10, "seed": 8}, headers={"X-Logto-User": "user1"}).json()]
+    assert first == again
+    assert len(set(first)) == 10 and set(first) <= set(item_ids)
+    assert first != other
+
+    # Asking for more than exists wraps around and returns everything once
+    everything = client.get(url, params={"size": 100, "seed": 7}, headers={"X-Logto-User": "user1"}).json()
+    assert sorted(i["id"] for i in everything) == sorted(item_ids)
+
+def test_split_data_items_partitions_project():
+    import sampling
+
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    item_ids = _create_items(project_id, 40)
+    params = {"seed": 3, "train": 0.5, "validation": 0.25, "test": 0.25}
+
+    splits = {
+        name: {i["id"] for i in client.get(f"/projects/{project_id}/data-items/split/{name}", params=params, headers={"X-Logto-User": "user1"}).json()}
+        for name in sampling.SPLITS
+    }
+    assert sum(len(ids) for ids in splits.values()) == 40
+    assert set().union(*splits.values()) == set(item_ids)
+
+    ratios = {"train": 0.5, "validation": 0.25, "test": 0.25}
+    for name, ids in splits.items():
+        assert all(sampling.assign_split(uuid.UUID(i), 3, ratios) == name for i in ids)
+
+    # Deleting an item does not move the others between splits
+    client.delete(f"/projects/{project_id}/data-items/{item_ids[0]}", headers={"X-Logto-User": "user1"})
+    train = {i["id"] for i in client.get(f"/projects/{project_id}/data-items/split/train", params=params, headers={"X-Logto-User": "user1"}).json()}
+    assert train == splits["train"] - {item_ids[0]}
+
+def test_split_arcs_cover_ring_when_wrapping():
+    import sampling
+
+    ratios = {"train": 0.8, "validation": 0.1, "test": 0.1}
+    for seed in range(20):
+        ranges = sorted(r for arcs in sampling.split_arcs(seed, ratios).values() for r in arcs if r[0] < r[1])
+        assert ranges[0][0] == 0 and ranges[-1][1] == sampling.RING_SIZE
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+def test_split_data_items_rejects_bad_ratios():
+    project_id = client.post("/projects/", json={"name": "Test Project"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    resp = client.get(f"/projects/{project_id}/data-items/split/train", params={"train": 0.9}, headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 422
+    resp = client.get(f"/projects/{project_id}/data-items/split/train", params={"train": "nan", "validation": 0.5, "test": 0.5}, headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 422
+
+def test_sample_starts_apart_from_train_split():
+    import sampling
+
+    # Otherwise a small sample would be drawn entirely from the start of the train split
+    assert all(sampling.sample_offset(seed) != sampling.seed_offset(seed) for seed in range(20))
+
+def _list_contents(project_id, user="user1"):
+    items = client.get(f"/projects/{project_id}/data-items/", headers={"X-Logto-User": user}).json()
+    return sorted(i["input_message"][0]["content"] for i in items)
+
+def test_fork_shares_items():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    _create_items(parent_id, 3)
+
+    resp = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 200
+    fork = resp.json()
+    assert fork["name"] == "Parent (fork)"
+    assert fork["forked_from_id"] == parent_id
+    assert fork["data_items_count"] == 3
+
+    assert _list_contents(fork["id"]) == _list_contents(parent_id)
+    parent_ids = {i["id"] for i in client.get(f"/projects/{parent_id}/data-items/", headers={"X-Logto-User": "user1"}).json()}
+    fork_ids = {i["id"] for i in client.get(f"/projects/{fork['id']}/data-items/", headers={"X-Logto-User": "user1"}).json()}
+    assert parent_ids == fork_ids
+
+    # No item rows were copied
+    db = app_db()
+    assert db.query(models.DataItem).filter(models.DataItem.project_id == uuid.UUID(parent_id)).count() == 3
+    assert db.query(models.DataItem).filter(models.DataItem.project_id == uuid.UUID(fork["id"])).count() == 0
+    db.close()
+
+    counts = {p["id"]: p["data_items_count"] for p in client.get("/projects/", headers={"X-Logto-User": "user1"}).json()}
+    assert counts[parent_id] == 3 and counts[fork["id"]] == 3
+
+def _row_count():
+    db = app_db()
+    count = db.query(models.DataItem).count()
+    db.close()
+    return count
+
+def test_fork_edits_are_isolated():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    a, b = _create_items(parent_id, 2)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={"name": "Variant"}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    # Editing in the fork copies the content; the item keeps its id and the parent the original
+    edited = client.patch(f"/projects/{fork_id}/data-items/{a}", json={
+        "input_message": [{"type": "text", "content": "Fork edit"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert edited["id"] == a
+    assert _list_contents(fork_id) == ["Fork edit", "Item 1"]
+    assert _list_contents(parent_id) == ["Item 0", "Item 1"]
+
+    # Editing the copy again happens in place
+    rows = _row_count()
+    again = client.patch(f"/projects/{fork_id}/data-items/{a}", json={
+        "input_message": [{"type": "text", "content": "Fork edit 2"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert again["id"] == a
+    assert _row_count() == rows
+
+    # Editing in the parent does not leak into the fork either
+    edited = client.patch(f"/projects/{parent_id}/data-items/{b}", json={
+        "input_message": [{"type": "text", "content": "Parent edit"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert edited["id"] == b
+    assert _list_contents(parent_id) == ["Item 0", "Parent edit"]
+    assert _list_contents(fork_id) == ["Fork edit 2", "Item 1"]
+
+def test_fork_deletes_and_creates_are_isolated():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    a, b, c = _create_items(parent_id, 3)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    assert client.delete(f"/projects/{fork_id}/data-items/{a}", headers={"X-Logto-User": "user1"}).status_code == 200
+    client.delete(f"/projects/{parent_id}/data-items/{b}", headers={"X-Logto-User": "user1"})
+    client.post(f"/projects/{fork_id}/data-items/", json={
+        "input_message": [{"type": "text", "content": "Only in fork"}]
+    }, headers={"X-Logto-User": "user1"})
+
+    assert _list_contents(parent_id) == ["Item 0", "Item 2"]
+    assert _list_contents(fork_id) == ["Item 1", "Item 2", "Only in fork"]
+
+    # The parent only holds b soft-deleted: the fork's edit leaves it the original
+    edited = client.patch(f"/projects/{fork_id}/data-items/{b}", json={
+        "output_message": [{"type": "text", "content": "Reply"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert edited["id"] == b
+
+    parent_stats = client.get(f"/projects/{parent_id}/stats", headers={"X-Logto-User": "user1"}).json()
+    fork_stats = client.get(f"/projects/{fork_id}/stats", headers={"X-Logto-User": "user1"}).json()
+    assert parent_stats["item_count"] == 2
+    assert fork_stats["item_count"] == 3
+    assert fork_stats["items_with_output"] == 1
+
+    for project_id, expected in ((parent_id, parent_stats), (fork_id, fork_stats)):
+        rebuilt = client.post(f"/projects/{project_id}/stats/rebuild", headers={"X-Logto-User": "user1"}).json()
+        assert {k: v for k, v in rebuilt.items() if k != "updated_at"} == {k: v for k, v in expected.items() if k != "updated_at"}
+
+    client.patch(f"/projects/{parent_id}/data-items/{b}", json={"deleted": False}, headers={"X-Logto-User": "user1"})
+    assert _list_contents(parent_id) == ["Item 0", "Item 1", "Item 2"]
+
+def test_fork_soft_delete_is_reversible():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    a, b = _create_items(parent_id, 2)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    deleted = client.patch(f"/projects/{fork_id}/data-items/{a}", json={"deleted": True}, headers={"X-Logto-User": "user1"}).json()
+    assert deleted["id"] == a and deleted["deleted"] is True
+    assert _list_contents(fork_id) == ["Item 1"]
+    assert client.get(f"/projects/{fork_id}/stats", headers={"X-Logto-User": "user1"}).json()["item_count"] == 1
+
+    resp = client.patch(f"/projects/{fork_id}/data-items/{a}", json={"deleted": False}, headers={"X-Logto-User": "user1"})
+    assert resp.status_code == 200
+    assert resp.json()["deleted"] is False
+    assert _list_contents(fork_id) == ["Item 0", "Item 1"]
+    assert client.get(f"/projects/{fork_id}/stats", headers={"X-Logto-User": "user1"}).json()["item_count"] == 2
+
+    # on_conflict=update revives a duplicate the fork shares with its parent
+    client.delete(f"/projects/{fork_id}/data-items/{b}", headers={"X-Logto-User": "user1"})
+    revived = client.post(f"/projects/{fork_id}/data-items/?on_conflict=update", json={
+        "input_message": [{"type": "text", "content": "Item 1"}]
+    }, headers={"X-Logto-User": "user1"}).json()
+    assert revived["id"] == b and revived["deleted"] is False
+    assert _list_contents(fork_id) == ["Item 0", "Item 1"]
+    assert _list_contents(parent_id) == ["Item 0", "Item 1"]
+
+def test_unchanged_update_does_not_copy():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    (a,) = _create_items(parent_id, 1)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    rows = _row_count()
+    assert client.patch(f"/projects/{fork_id}/data-items/{a}", json={}, headers={"X-Logto-User": "user1"}).status_code == 200
+    client.patch(f"/projects/{fork_id}/data-items/{a}", json={
+        "input_message": [{"type": "text", "content": "Item 0"}]
+    }, headers={"X-Logto-User": "user1"})
+    assert _row_count() == rows
+
+def test_edits_under_dormant_fork_copy_once():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    a, b = _create_items(parent_id, 2)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+    other_fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+    client.delete(f"/projects/{fork_id}/data-items/{a}", headers={"X-Logto-User": "user1"})
+    client.patch(f"/projects/{other_fork_id}", json={"deleted": True}, headers={"X-Logto-User": "user1"})
+
+    # Only dormant items share a now: they get one frozen copy, later edits are in place
+    rows = _row_count()
+    for content in ["First", "Second", "Third"]:
+        client.patch(f"/projects/{parent_id}/data-items/{a}", json={
+            "input_message": [{"type": "text", "content": content}]
+        }, headers={"X-Logto-User": "user1"})
+    assert _row_count() == rows + 1
+    assert _list_contents(parent_id) == ["Item 1", "Third"]
+
+    # Restoring the fork's item or the whole fork shows the content it had
+    client.patch(f"/projects/{fork_id}/data-items/{a}", json={"deleted": False}, headers={"X-Logto-User": "user1"})
+    client.patch(f"/projects/{other_fork_id}", json={"deleted": False}, headers={"X-Logto-User": "user1"})
+    assert _list_contents(fork_id) == ["Item 0", "Item 1"]
+    assert _list_contents(other_fork_id) == ["Item 0", "Item 1"]
+
+    for project_id in (parent_id, fork_id, other_fork_id):
+        current = client.get(f"/projects/{project_id}/stats", headers={"X-Logto-User": "user1"}).json()
+        rebuilt = client.post(f"/projects/{project_id}/stats/rebuild", headers={"X-Logto-User": "user1"}).json()
+        assert {k: v for k, v in rebuilt.items() if k != "updated_at"} == {k: v for k, v in current.items() if k != "updated_at"}
+
+def test_fork_keeps_splits_through_edits():
+    import sampling
+
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    item_ids = _create_items(parent_id, 30)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    for item_id in item_ids[:29]:
+        client.patch(f"/projects/{parent_id}/data-items/{item_id}", json={
+            "output_message": [{"type": "text", "content": "Reply"}]
+        }, headers={"X-Logto-User": "user1"})
+
+    ratios = {"train": 0.8, "validation": 0.1, "test": 0.1}
+    expected = {i for i in item_ids if sampling.assign_split(uuid.UUID(i), 0, ratios) == "train"}
+    for project_id in (parent_id, fork_id):
+        train = client.get(f"/projects/{project_id}/data-items/split/train", headers={"X-Logto-User": "user1"}).json()
+        assert {i["id"] for i in train} == expected
+
+    assert client.get(f"/projects/{parent_id}/stats", headers={"X-Logto-User": "user1"}).json()["items_with_output"] == 29
+    assert client.get(f"/projects/{fork_id}/stats", headers={"X-Logto-User": "user1"}).json()["items_with_output"] == 0
+
+def test_fork_sampling_and_ownership():
+    parent_id = client.post("/projects/", json={"name": "Parent"}, headers={"X-Logto-User": "user1"}).json()["id"]
+    _create_items(parent_id, 10)
+    fork_id = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user1"}).json()["id"]
+
+    params = {"size": 4, "seed": 1}
+    parent_sample = client.get(f"/projects/{parent_id}/data-items/sample", params=params, headers={"X-Logto-User": "user1"}).json()
+    fork_sample = client.get(f"/projects/{fork_id}/data-items/sample", params=params, headers={"X-Logto-User": "user1"}).json()
+    assert [i["id"] for i in parent_sample] == [i["id"] for i in fork_sample]
+
+    resp = client.post(f"/projects/{parent_id}/fork", json={}, headers={"X-Logto-User": "user2"})
+    assert resp.status_code == 404
+
+def test_concurrent_edits_of_shared_item():
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import forks
+
+    # Two real sessions on the file database, so their transactions contend
+    db = TestingSessionLocal()
+    user = models.User(logto_id="concurrent_user")
+    db.add(user)
+    db.flush()
+    parent = models.Project(name="Parent", owner_id=user.id)
+    db.add(parent)
+    db.flush()
+    forks.add_item(db, parent.id, models.DataItem(
+        project_id=parent.id, input_message=[{"type": "text", "content": "Shared"}]
+    ))
+    db.commit()
+    fork = forks.fork_project(db, parent, "Fork")
+    db.commit()
+    parent_id, fork_id = parent.id, fork.id
+    db.close()
+
+    first_locked, release_first = threading.Event(), threading.Event()
+
+    def edit(project_id, content, locked=None, release=None):
+        session = TestingSessionLocal()
+        try:
+            item = forks.project_items(session, project_id).one()
+            row = forks.writable_row(session, item)
+            if locked:
+                locked.set()
+                release.wait(5)
+            row.input_message = [{"type": "text", "content": content}]
+            session.commit()
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(edit, parent_id, "Parent edit", first_locked, release_first)
+        assert first_locked.wait(5)
+        second = pool.submit(edit, fork_id, "Fork edit")
+        # Give the fork's edit time to queue behind the parent's
+        time.sleep(0.2)
+        release_first.set()
+        first.result(timeout=10)
+        second.result(timeout=10)
+
+    db = TestingSessionLocal()
+    contents = {
+        project_id: forks.project_items(db, project_id).one().input_message[0]["content"]
+        for project_id in (parent_id, fork_id)
+    }
+    assert contents == {parent_id: "Parent edit", fork_id: "Fork edit"}
+    # The parent copied, then the fork found itself alone on the original row
+    assert db.query(models.DataItem).count() == 2
+    for project_id in (parent_id, fork_id):
+        assert db.get(models.ProjectStats, project_id).text_length_total == len(contents[project_id])
+    db.close()
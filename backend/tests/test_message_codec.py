@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, select
+from sqlalchemy.pool import StaticPool
+
+import message_codec
+import models
+
+MESSAGES = [
+    {"type": "text", "content": "Héllo wörld 👋"},
+    {"type": "image", "content": "https://example.com/cat.png"},
+    {"type": "text", "content": ""},
+]
+
+
+@pytest.mark.parametrize("messages", [MESSAGES, [], [{"type": "text", "content": "long " * 500}]])
+def test_round_trip(messages):
+    assert message_codec.decode(message_codec.encode(messages)) == messages
+    assert message_codec.decode(message_codec.encode(messages, compact=False)) == messages
+
+
+def test_none_is_stored_as_null():
+    assert message_codec.encode(None) is None
+    assert message_codec.decode(None) is None
+
+
+def test_format_byte():
+    assert message_codec.encode(MESSAGES)[0] == message_codec.PACKED
+    assert message_codec.encode([{"type": "text", "content": "long " * 500}])[0] == message_codec.PACKED_ZLIB
+    assert message_codec.encode(MESSAGES, compact=False) == json.dumps(MESSAGES, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def test_compact_is_smaller_than_json():
+    assert len(message_codec.encode(MESSAGES)) < len(message_codec.encode(MESSAGES, compact=False))
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        message_codec.decode(b"\x7f")
+
+
+def test_many_messages_round_trip():
+    # More messages than a 16-bit count could hold
+    messages = [{"type": "text", "content": "x"}] * 70000
+    assert message_codec.decode(message_codec.encode(messages)) == messages
+
+
+def _message_table(storage):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    metadata = MetaData()
+    table = Table(
+        "messages", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("messages", models.MessageArray(storage), nullable=True),
+    )
+    metadata.create_all(bind=engine)
+    return engine, table
+
+
+def test_compact_column_reads_both_formats():
+    engine, table = _message_table("compact")
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{"id": 1, "messages": MESSAGES}, {"id": 2, "messages": None}])
+        stored = connection.exec_driver_sql("SELECT messages FROM messages WHERE id = 1").scalar()
+        assert stored[0] == message_codec.PACKED
+
+        # Rows holding codec JSON read back the same way
+        connection.exec_driver_sql(
+            "UPDATE messages SET messages = ? WHERE id = 1", (message_codec.encode(MESSAGES, compact=False),)
+        )
+        rows = dict(connection.execute(select(table.c.id, table.c.messages)).all())
+    assert rows == {1: MESSAGES, 2: None}
+
+
+def test_json_column_stores_plain_json():
+    engine, table = _message_table("json")
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{"id": 1, "messages": MESSAGES}])
+        stored = connection.exec_driver_sql("SELECT messages FROM messages").scalar()
+        assert json.loads(stored) == MESSAGES
+        assert connection.execute(select(table.c.messages)).scalar() == MESSAGES
+
+
+
+def test_unknown_storage_is_rejected():
+    with pytest.raises(ValueError):
+        models.MessageArray("jsonb")
+
+    result = subprocess.run(
+        [sys.executable, "-c", "import models"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "MESSAGE_STORAGE": "Compact"},
+        capture_output=True,
+    )
+    assert result.returncode != 0
+    assert b"MESSAGE_STORAGE must be one of" in result.stderr
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(route_classes):
+    clock = FakeClock()
+    rate_limiter = ratelimit.RateLimiter(route_classes=route_classes, clock=clock)
+    app = FastAPI()
+
+    @app.get("/items", dependencies=[Depends(ratelimit.limit("read", rate_limiter))])
+    def read_items():
+        return []
+
+    @app.post("/items", dependencies=[Depends(ratelimit.limit("write", rate_limiter))])
+    def create_item():
+        return {}
+
+    return TestClient(app), clock
+
+
+def test_burst_is_capped_then_refills():
+    client, clock = make_client({"read": (2, 5), "write": (1, 1)})
+
+    statuses = [client.get("/items", headers={"X-Logto-User": "bursty"}).status_code for _ in range(8)]
+    assert statuses == [200] * 5 + [429] * 3
+
+    resp = client.get("/items", headers={"X-Logto-User": "bursty"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "1"
+
+    # Two tokens per second: after one second the client gets two more requests
+    clock.now += 1
+    statuses = [client.get("/items", headers={"X-Logto-User": "bursty"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_bursty_user_does_not_starve_others():
+    client, clock = make_client({"read": (1, 3), "write": (1, 1)})
+
+    for _ in range(10):
+        client.get("/items", headers={"X-Logto-User": "bursty"})
+    assert client.get("/items", headers={"X-Logto-User": "bursty"}).status_code == 429
+    assert client.get("/items", headers={"X-Logto-User": "polite"}).status_code == 200
+
+
+def test_route_classes_have_separate_buckets():
+    client, clock = make_client({"read": (1, 10), "write": (0.5, 1)})
+
+    assert client.post("/items", headers={"X-Logto-User": "user"}).status_code == 200
+    resp = client.post("/items", headers={"X-Logto-User": "user"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "2"
+    assert client.get("/items", headers={"X-Logto-User": "user"}).status_code == 200
+
+
+def test_concurrent_burst_is_limited_exactly():
+    client, clock = make_client({"read": (1, 20), "write": (1, 1)})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(
+            lambda _: client.get("/items", headers={"X-Logto-User": "bursty"}).status_code,
+            range(50)
+        ))
+    assert statuses.count(200) == 20
+    assert statuses.count(429) == 30
+
+
+def test_concurrency_cap_returns_503():
+    release = threading.Event()
+    entered = threading.Semaphore(0)
+    app = FastAPI()
+    app.add_middleware(ratelimit.ConcurrencyLimitMiddleware, max_concurrent=2)
+
+    @app.get("/slow")
+    def slow():
+        entered.release()
+        release.wait(5)
+        return {}
+
+    client = TestClient(app)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pending = [pool.submit(client.get, "/slow") for _ in range(2)]
+        entered.acquire(timeout=5)
+        entered.acquire(timeout=5)
+
+        resp = client.get("/slow")
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == "1"
+
+        release.set()
+        assert [f.result().status_code for f in pending] == [200, 200]
+
+    assert client.get("/slow").status_code == 200
+
+
+def test_streams_count_only_until_they_respond():
+    started = threading.Event()
+    finish = threading.Event()
+    release = threading.Event()
+    entered = threading.Semaphore(0)
+    app = FastAPI()
+    app.add_middleware(ratelimit.ConcurrencyLimitMiddleware, max_concurrent=1, streaming=lambda path: path == "/stream")
+
+    @app.get("/stream")
+    def stream():
+        async def body():
+            started.set()
+            yield b"connected"
+            while not finish.is_set():
+                await asyncio.sleep(0.01)
+        return StreamingResponse(body())
+
+    @app.get("/slow")
+    def slow():
+        entered.release()
+        release.wait(5)
+        return {}
+
+    client = TestClient(app)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        # An open stream does not hold a slot...
+        streaming = pool.submit(client.get, "/stream")
+        assert started.wait(5)
+        pending = pool.submit(client.get, "/slow")
+        assert entered.acquire(timeout=5)
+
+        # ...but opening one needs a free slot, like any other request
+        assert client.get("/stream").status_code == 503
+
+        release.set()
+        finish.set()
+        assert pending.result().status_code == 200
+        assert streaming.result().status_code == 200
+
+
+def test_memory_store_drops_full_buckets():
+    store = ratelimit.MemoryStore(sweep_interval=10)
+    for i in range(1000):
+        store.take(f"read:rotating-{i}", 1, 5, now=0)
+    assert len(store) == 1000
+    store.take("read:steady", 1, 5, now=1)
+
+    # Every rotated key has refilled to its burst by the next sweep
+    store.take("read:steady", 1, 5, now=10)
+    assert len(store) == 1
+
+    # A bucket that is still short of its burst is kept
+    for _ in range(5):
+        store.take("bulk:busy", 0.1, 5, now=10)
+    store.take("read:other", 1, 5, now=20)
+    assert len(store) == 2
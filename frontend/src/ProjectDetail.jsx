@@ -4,6 +4,9 @@ import { useLogto } from '@logto/react';
 import './App.css';
 import './ProjectDetail.css';
 
+const STREAM_RETRY_INITIAL_MS = 1000;
+const STREAM_RETRY_MAX_MS = 60000;
+
 function ProjectDetail() {
   const { projectId } = useParams();
   const { isAuthenticated, getAccessToken } = useLogto();
@@ -55,6 +58,101 @@ function ProjectDetail() {
     }
   }, [isAuthenticated, fetchProjectData]);
 
+  const applyDataItem = useCallback((item) => {
+    setDataItems(items => {
+      if (item.deleted) return items.filter(i => i.id !== item.id);
+      const index = items.findIndex(i => i.id === item.id);
+      if (index === -1) return [...items, item];
+      const next = [...items];
+      next[index] = item;
+      return next;
+    });
+  }, []);
+
+  // Live updates: the server pushes created/updated/deleted events for this project.
+  // fetch() is used instead of EventSource so the auth headers can be sent.
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    const controller = new AbortController();
+
+    const handleEvent = (event) => {
+      if (event.type === 'resync') {
+        fetchProjectData();
+      } else if (event.type === 'deleted') {
+        setDataItems(items => items.filter(i => i.id !== event.item_id));
+      } else if (event.item) {
+        applyDataItem(event.item);
+      }
+    };
+
+    const sleep = (ms) => new Promise(resolve => {
+      const timer = setTimeout(resolve, ms);
+      controller.signal.addEventListener('abort', () => {
+        clearTimeout(timer);
+        resolve();
+      }, { once: true });
+    });
+
+    // Seconds or an HTTP date, as the limiter and the concurrency cap send it
+    const retryAfterMs = (response) => {
+      const value = response.headers.get('Retry-After');
+      if (!value) return null;
+      const seconds = Number(value);
+      if (!Number.isNaN(seconds)) return seconds * 1000;
+      const date = Date.parse(value);
+      return Number.isNaN(date) ? null : Math.max(0, date - Date.now());
+    };
+
+    const listen = async () => {
+      let delay = STREAM_RETRY_INITIAL_MS;
+      // Only a stream that was open can have missed events; failed attempts can't
+      let missedEvents = false;
+      while (!controller.signal.aborted) {
+        let wait = null;
+        try {
+          const token = await getAccessToken();
+          const response = await fetch(`${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/projects/${projectId}/events`, {
+            headers: {
+              Authorization: `Bearer ${token}`,
+              'X-Logto-User': 'test_user_id'
+            },
+            signal: controller.signal
+          });
+          // The project is gone or not ours: retrying won't change that
+          if (response.status === 404) return;
+          if (!response.ok) {
+            wait = retryAfterMs(response);
+            throw new Error('Failed to subscribe to project events');
+          }
+          delay = STREAM_RETRY_INITIAL_MS;
+          if (missedEvents) fetchProjectData();
+          missedEvents = true;
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+          let buffer = '';
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const chunks = buffer.split('\n\n');
+            buffer = chunks.pop();
+            for (const chunk of chunks) {
+              const data = chunk.split('\n').find(line => line.startsWith('data: '));
+              if (data) handleEvent(JSON.parse(data.slice('data: '.length)));
+            }
+          }
+        } catch (err) {
+          if (controller.signal.aborted) return;
+        }
+        // Back off exponentially, with jitter so clients don't reconnect in lockstep
+        await sleep(wait ?? delay * (0.5 + Math.random() / 2));
+        delay = Math.min(delay * 2, STREAM_RETRY_MAX_MS);
+      }
+    };
+
+    listen();
+    return () => controller.abort();
+  }, [isAuthenticated, projectId, getAccessToken, fetchProjectData, applyDataItem]);
+
   const handleOpenModal = (item = null) => {
     setCurrentDataItem(item);
     if (item) {
@@ -111,7 +209,7 @@ function ProjectDetail() {
         throw new Error(errData.detail?.[0]?.msg || errData.detail || 'Failed to save data item');
       }
 
-      await fetchProjectData();
+      applyDataItem(await response.json());
       handleCloseModal();
     } catch (err) {
       setError(err.message);
@@ -132,7 +230,27 @@ function ProjectDetail() {
         }
       });
       if (!response.ok) throw new Error('Failed to delete item');
-      await fetchProjectData();
+      setDataItems(items => items.filter(i => i.id !== itemId));
+    } catch (err) {
+      alert(err.message);
+    }
+  };
+
+  const handleForkProject = async () => {
+    try {
+      const token = await getAccessToken();
+      const response = await fetch(`${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/projects/${projectId}/fork`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${token}`,
+          'X-Logto-User': 'test_user_id'
+        },
+        body: JSON.stringify({})
+      });
+      if (!response.ok) throw new Error('Failed to fork project');
+      const fork = await response.json();
+      navigate(`/projects/${fork.id}`);
     } catch (err) {
       alert(err.message);
     }
@@ -164,6 +282,7 @@ function ProjectDetail() {
           </div>
           <div className="nav-links">
             <button className="btn btn-secondary" onClick={() => navigate('/dashboard')}>Back to Dashboard</button>
+            <button className="btn btn-secondary" onClick={handleForkProject}>Fork Project</button>
             <button className="btn btn-primary" onClick={() => handleOpenModal()}>+ Add Data Item</button>
           </div>
         </div>